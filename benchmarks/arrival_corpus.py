@@ -0,0 +1,96 @@
+"""Compare ``ArrivalParser`` with the previous dateutil-based arrival formatting.
+
+Usage: python benchmarks/arrival_corpus.py
+
+The corpus and its expected output for the reference date 2026-10-16
+(Friday) live in tests/test_arrival.py. The script prints where the new
+parser matches the legacy output, where it fixes it, and the time taken by
+both.
+"""
+from __future__ import annotations
+
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from dateutil import parser as date_parser
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from order_sync.arrival import ARRIVAL_KEYWORDS, ArrivalParser  # noqa: E402
+from tests.test_arrival import CORPUS, REFERENCE_DATE  # noqa: E402
+
+def legacy_format_arrival(text: str, base: datetime) -> str:
+    text = (text or "").strip()
+    if not text:
+        return "不明"
+    normalized = text.replace("までにお届け", "にお届け")
+    for keyword, replacement in ARRIVAL_KEYWORDS:
+        if keyword in normalized:
+            normalized = normalized.replace("にお届け済み", "到着済")
+            normalized = normalized.replace(keyword, replacement)
+            break
+    try:
+        explicit_date = date_parser.parse(normalized, fuzzy=True, default=base)
+    except (ValueError, OverflowError):
+        explicit_date = None
+    if explicit_date:
+        suffix = "到着済" if "到着済" in normalized else "到着予定"
+        return f"{explicit_date.month}月{explicit_date.day}日{suffix}"
+    if "明日" in normalized:
+        target = base + timedelta(days=1)
+        return f"{target.month}月{target.day}日到着予定"
+    if "今日" in normalized:
+        return f"{base.month}月{base.day}日到着予定"
+    for label, weekday in (("月曜", 0), ("火曜", 1), ("水曜", 2), ("木曜", 3), ("金曜", 4), ("土曜", 5), ("日曜", 6)):
+        if label in normalized:
+            days_ahead = (weekday - base.weekday()) % 7 or 7
+            target = base + timedelta(days=days_ahead)
+            return f"{target.month}月{target.day}日到着予定"
+    if "到着" in normalized:
+        return normalized
+    return "不明"
+
+
+def main() -> int:
+    base = datetime.combine(REFERENCE_DATE, datetime.min.time())
+    parser = ArrivalParser(REFERENCE_DATE)
+    matched = fixed = failed = 0
+    for text, expected in CORPUS:
+        legacy = legacy_format_arrival(text, base)
+        current = parser.format(text)
+        if current != expected:
+            failed += 1
+            label = "NG"
+        elif legacy == expected:
+            matched += 1
+            label = "一致"
+        else:
+            fixed += 1
+            label = "改善"
+        print(f"{label:<4} {text!r:<36} 旧: {legacy:<20} 新: {current}")
+    print(f"\n一致 {matched} 件 / 改善 {fixed} 件 / 不一致 {failed} 件")
+
+    texts = [text for text, _ in CORPUS] * 2000
+    started = time.perf_counter()
+    for text in texts:
+        legacy_format_arrival(text, base)
+    legacy_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for text in texts:
+        parser._format(text)
+    uncached_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for text in texts:
+        parser.format(text)
+    cached_seconds = time.perf_counter() - started
+    print(
+        f"{len(texts)} 件: 旧 {legacy_seconds:.3f}秒 / 新(キャッシュなし) {uncached_seconds:.3f}秒"
+        f" / 新(キャッシュあり) {cached_seconds:.3f}秒"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
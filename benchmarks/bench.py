@@ -0,0 +1,223 @@
+"""Benchmarks for the hot paths of order_sync.
+
+Usage:
+    python benchmarks/bench.py                       # 1k / 10k / 100k orders
+    python benchmarks/bench.py --sizes 1000 10000 --save-baseline
+    python benchmarks/bench.py --compare             # compare with benchmarks/baseline.json
+
+Each path is run twice per size: once for wall time and once under
+tracemalloc for the peak memory, so the tracing overhead does not skew the
+throughput figures. Inputs are generated before the timer starts, except
+for the history pages, which are generated lazily and excluded from the
+measured time.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import fixtures  # noqa: E402
+from order_sync.amazon import AmazonOrderFetcher  # noqa: E402
+from order_sync.csv_writer import CsvWriter  # noqa: E402
+from order_sync.gmail_client import GmailClient, GmailConfig, StatusDetector  # noqa: E402
+from order_sync.processing import OrderProcessor  # noqa: E402
+from order_sync.report import aggregate, load_columns  # noqa: E402
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+PATHS = ("parse", "detect", "process", "csv", "report")
+
+
+def bench_parse(count: int, cards_per_page: int, items: int) -> Callable[[], float]:
+    fetcher = AmazonOrderFetcher()
+    start, end = fixtures.window(count)
+
+    def run() -> float:
+        elapsed = 0.0
+        parsed = 0
+        for html in fixtures.iter_history_pages(count, cards_per_page, items):
+            started = time.perf_counter()
+            parsed += sum(1 for _ in fetcher._parse_orders(html, start, end))
+            elapsed += time.perf_counter() - started
+        assert parsed == count, parsed
+        return elapsed
+
+    return run
+
+
+def bench_detect(count: int, cards_per_page: int, items: int) -> Callable[[], float]:
+    detector = StatusDetector()
+    mails = [
+        (subject, GmailClient._decode_body(fixtures.gmail_message("", subject, body)))
+        for index in range(count)
+        for subject, body in fixtures.mail_texts(index)
+    ]
+
+    def run() -> float:
+        started = time.perf_counter()
+        for subject, body in mails:
+            detector.detect(subject, body)
+        return time.perf_counter() - started
+
+    return run
+
+
+def bench_process(count: int, cards_per_page: int, items: int) -> Callable[[], float]:
+    orders = list(fixtures.iter_orders(count, items))
+
+    def run() -> float:
+        client = GmailClient(GmailConfig(cache_file=None), service=fixtures.FakeGmailService(count))
+        processor = OrderProcessor(StatusDetector(), client, today=fixtures.WINDOW_END.date())
+        started = time.perf_counter()
+        records = processor.process_orders(orders)
+        elapsed = time.perf_counter() - started
+        assert len(records) == count * max(1, items), len(records)
+        return elapsed
+
+    return run
+
+
+def bench_csv(count: int, cards_per_page: int, items: int) -> Callable[[], float]:
+    client = GmailClient(GmailConfig(cache_file=None), service=fixtures.FakeGmailService(count))
+    processor = OrderProcessor(StatusDetector(), client, today=fixtures.WINDOW_END.date())
+    records = processor.process_orders(fixtures.iter_orders(count, items))
+
+    def run() -> float:
+        with tempfile.TemporaryDirectory() as directory:
+            writer = CsvWriter(Path(directory) / "orders.csv")
+            started = time.perf_counter()
+            writer.write(records)
+            return time.perf_counter() - started
+
+    return run
+
+
+def bench_report(count: int, cards_per_page: int, items: int) -> Callable[[], float]:
+    client = GmailClient(GmailConfig(cache_file=None), service=fixtures.FakeGmailService(count))
+    processor = OrderProcessor(StatusDetector(), client, today=fixtures.WINDOW_END.date())
+    records = processor.process_orders(fixtures.iter_orders(count, items))
+
+    def run() -> float:
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "orders.csv"
+            CsvWriter(output).write(records)
+            started = time.perf_counter()
+            report = aggregate(load_columns(output, "csv"), as_of=fixtures.WINDOW_END.date())
+            elapsed = time.perf_counter() - started
+        assert report["orders"] == count, report["orders"]
+        return elapsed
+
+    return run
+
+
+BENCHMARKS: dict[str, Callable[[int, int, int], Callable[[], float]]] = {
+    "parse": bench_parse,
+    "detect": bench_detect,
+    "process": bench_process,
+    "csv": bench_csv,
+    "report": bench_report,
+}
+
+
+def measure(path: str, count: int, cards_per_page: int, items: int) -> dict[str, float]:
+    run = BENCHMARKS[path](count, cards_per_page, items)
+    seconds = run()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": round(seconds, 4),
+        "orders_per_second": round(count / seconds, 1) if seconds else 0.0,
+        "peak_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions: list[str] = []
+    print(f"\n{'ベンチマーク':<16}{'基準 件/秒':>14}{'今回 件/秒':>14}{'速度比':>8}{'基準 MB':>10}{'今回 MB':>10}")
+    for key, current in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if previous is None:
+            continue
+        speed = current["orders_per_second"] / previous["orders_per_second"] if previous["orders_per_second"] else 0.0
+        print(
+            f"{key:<16}{previous['orders_per_second']:>14,.0f}{current['orders_per_second']:>14,.0f}"
+            f"{speed:>8.2f}{previous['peak_mb']:>10.1f}{current['peak_mb']:>10.1f}"
+        )
+        if speed < 1 - tolerance:
+            regressions.append(f"{key}: 処理速度が基準の {speed:.0%} に低下")
+        if previous["peak_mb"] and current["peak_mb"] > previous["peak_mb"] * (1 + tolerance):
+            regressions.append(f"{key}: ピークメモリが {previous['peak_mb']} MB から {current['peak_mb']} MB に増加")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="order_sync の主要処理のベンチマーク")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="注文件数")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS), help="計測する処理")
+    parser.add_argument("--cards-per-page", type=int, default=10, help="注文履歴1ページあたりの注文数")
+    parser.add_argument("--items", type=int, default=2, help="注文あたりの商品数")
+    parser.add_argument(
+        "--save-baseline", nargs="?", type=Path, const=DEFAULT_BASELINE, help="結果を基準値として保存する"
+    )
+    parser.add_argument(
+        "--compare", nargs="?", type=Path, const=DEFAULT_BASELINE, help="保存済みの基準値と比較する"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.15, help="劣化とみなす割合 (既定: 0.15)")
+    args = parser.parse_args(argv)
+
+    results: dict[str, dict[str, float]] = {}
+    print(f"{'ベンチマーク':<16}{'秒':>10}{'件/秒':>14}{'ピークMB':>10}")
+    for count in args.sizes:
+        for path in args.paths:
+            key = f"{path}@{count}"
+            results[key] = measure(path, count, args.cards_per_page, args.items)
+            result = results[key]
+            print(f"{key:<16}{result['seconds']:>10.3f}{result['orders_per_second']:>14,.0f}{result['peak_mb']:>10.2f}")
+
+    if args.save_baseline:
+        args.save_baseline.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "cards_per_page": args.cards_per_page,
+                    "items": args.items,
+                    "results": results,
+                },
+                ensure_ascii=False,
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        print(f"\n基準値を保存しました: {args.save_baseline}")
+
+    if args.compare:
+        if not args.compare.exists():
+            print(f"基準値のファイルが見つかりません: {args.compare}")
+            return 2
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n劣化を検出しました:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\n基準値からの劣化はありません。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""Synthetic order-history pages, orders and Gmail payloads for the benchmarks."""
+from __future__ import annotations
+
+import base64
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from order_sync.models import Order, OrderItem
+
+WINDOW_END = datetime(2026, 10, 16)
+QUOTED_TERM_PATTERN = re.compile(r'"([^"]+)"')
+
+# 実際の通知メールに近い長さにするための定型文
+MAIL_FOOTER = (
+    "Amazon.co.jpをご利用いただき、ありがとうございます。\n"
+    "ご注文の詳細は注文履歴からご確認いただけます。\n"
+    "このメールアドレスは配信専用です。このメッセージに返信しないようお願いいたします。\n"
+) * 8
+
+
+def order_number(index: int) -> str:
+    return f"250-{index % 10_000_000:07d}-{index // 10_000_000 + 1000000:07d}"
+
+
+def order_date(index: int) -> datetime:
+    # 新しい順に、1日あたり数件の注文が並ぶ
+    return WINDOW_END - timedelta(days=index // 4)
+
+
+def window(count: int) -> tuple[datetime, datetime]:
+    return order_date(count), WINDOW_END
+
+
+def _arrival_text(index: int, date: datetime) -> str:
+    arrival = date + timedelta(days=2)
+    if index % 5 == 0:
+        return "明日にお届け予定"
+    return f"{arrival.month}月{arrival.day}日にお届け済み"
+
+
+def make_order(index: int, items: int = 2) -> Order:
+    date = order_date(index)
+    return Order(
+        order_date=date,
+        order_number=order_number(index),
+        price=f"￥{1000 + index % 9000:,}",
+        arrival_raw=_arrival_text(index, date),
+        delivery_name="山田 太郎",
+        delivery_address="東京都千代田区千代田 1-2-3 ベンチマークマンション 101",
+        items=[
+            OrderItem(title=f"商品 {index}-{item} ベンチマーク用の長い商品名 サイズM ブラック", quantity=str(item + 1))
+            for item in range(items)
+        ],
+    )
+
+
+def iter_orders(count: int, items: int = 2) -> Iterator[Order]:
+    for index in range(count):
+        yield make_order(index, items)
+
+
+def _card_html(index: int, items: int) -> str:
+    date = order_date(index)
+    item_rows = "".join(
+        '<div class="a-fixed-left-grid"><div class="a-fixed-left-grid-inner">'
+        f'<div class="a-fixed-left-grid-col a-col-left"><span class="item-view-qty">{item + 1}</span></div>'
+        '<div class="a-fixed-left-grid-col a-col-right"><div class="a-row">'
+        f'<a class="a-link-normal" href="/gp/product/B0{index:08d}{item}">'
+        f"商品 {index}-{item} ベンチマーク用の長い商品名 サイズM ブラック</a></div>"
+        '<div class="a-row"><span class="a-size-small">販売: Amazon.co.jp</span></div></div></div></div>'
+        for item in range(items)
+    )
+    return (
+        '<div class="a-box-group a-spacing-base order">'
+        '<div class="a-box a-color-offset-background order-info"><div class="a-box-inner">'
+        '<div class="a-row a-size-mini"><span class="a-color-secondary label">注文番号</span>'
+        f'<span class="a-color-secondary value">{order_number(index)}</span></div>'
+        f'<span class="a-color-secondary order-date-invoice-item">注文日 {date.year}/{date.month}/{date.day}</span>'
+        '<div class="a-column"><span class="a-color-secondary label">合計</span>'
+        f'<span class="a-color-secondary"><span class="a-color-price">￥{1000 + index % 9000:,}</span></span></div>'
+        '<div class="a-column"><div class="a-row"><div>お届け先</div><div>山田 太郎</div>'
+        "<div>東京都千代田区千代田</div><div>1-2-3 ベンチマークマンション 101</div></div></div>"
+        '</div></div><div class="a-box shipment"><div class="a-box-inner">'
+        f'<div class="a-row a-size-base a-color-secondary">{_arrival_text(index, date)}</div>'
+        f"{item_rows}</div></div></div>"
+    )
+
+
+def history_page(first: int, cards: int, items: int = 2, has_next: bool = True, filler: int = 200) -> str:
+    """One order-history page with ``cards`` order cards starting at order ``first``."""
+    body = "".join(_card_html(index, items) for index in range(first, first + cards))
+    if has_next:
+        pagination = f'<ul class="a-pagination"><li class="a-last"><a href="?startIndex={first + cards}">次へ</a></li></ul>'
+    else:
+        pagination = '<ul class="a-pagination"><li class="a-disabled a-last">次へ</li></ul>'
+    # ヘッダーやおすすめ欄などの注文以外の要素
+    chrome = (
+        '<div id="nav-main"><script>window.ue_t0 = 1;</script>'
+        + '<div class="nav-item"><a href="#">ナビゲーション</a><span>おすすめ商品</span></div>' * filler
+        + "</div>"
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>注文履歴</title></head><body>"
+        f'{chrome}<div id="ordersContainer">{body}</div>{pagination}{chrome}</body></html>'
+    )
+
+
+def iter_history_pages(count: int, cards_per_page: int = 10, items: int = 2) -> Iterator[str]:
+    for first in range(0, count, cards_per_page):
+        cards = min(cards_per_page, count - first)
+        yield history_page(first, cards, items, has_next=first + cards < count)
+
+
+def mail_texts(index: int) -> list[tuple[str, str]]:
+    """Subjects and bodies of the mails Amazon sends for order ``index``."""
+    number = order_number(index)
+    mails = [
+        (
+            f"Amazon.co.jp ご注文の確認 {number}",
+            f"注文済み: ご注文ありがとうございます。\n注文番号: {number}\n{MAIL_FOOTER}",
+        )
+    ]
+    kind = index % 4
+    if kind == 1:
+        mails.append((f"発送済み: 「商品 {index}-0」", f"注文番号: {number}\nお届け予定日をご確認ください。\n{MAIL_FOOTER}"))
+    elif kind == 2:
+        mails.append(
+            (
+                "Amazon.co.jp 配達完了のお知らせ",
+                f"注文番号: {number}\n宅配ボックスに配達しました。\n"
+                f"ボックス番号: {index % 40 + 1}\n暗証番号: {index % 9000 + 1000}\n{MAIL_FOOTER}",
+            )
+        )
+    elif kind == 3:
+        mails.append((f"ご注文のキャンセル {number}", f"注文番号: {number}\nキャンセルを承りました。\n{MAIL_FOOTER}"))
+    return mails
+
+
+def _encode(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def gmail_message(
+    message_id: str,
+    subject: str,
+    body: str,
+    format: str = "full",
+    metadata_headers: list[str] | None = None,
+) -> dict:
+    headers = [
+        {"name": "Subject", "value": subject},
+        {"name": "From", "value": "auto-confirm@amazon.co.jp"},
+    ]
+    if format == "metadata":
+        names = {name.lower() for name in metadata_headers or ("Subject",)}
+        return {
+            "id": message_id,
+            "payload": {"headers": [header for header in headers if header["name"].lower() in names]},
+        }
+    html = f"<html><body><pre>{body}</pre></body></html>"
+    return {
+        "id": message_id,
+        "threadId": message_id,
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "headers": headers,
+            "parts": [
+                {"mimeType": "text/plain", "body": {"size": len(body), "data": _encode(body)}},
+                {"mimeType": "text/html", "body": {"size": len(html), "data": _encode(html)}},
+            ],
+        },
+    }
+
+
+class _HttpError(Exception):
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.resp = type("Response", (), {"status": status})()
+
+
+class _Request:
+    def __init__(self, service: "FakeGmailService", factory):
+        self.service = service
+        self.factory = factory
+
+    def execute(self, num_retries: int = 0):
+        self.service.api_calls += 1
+        return self.factory()
+
+
+class _Batch:
+    def __init__(self, service: "FakeGmailService", callback):
+        self.service = service
+        self.callback = callback
+        self.requests: list[tuple[str, _Request]] = []
+
+    def add(self, request: _Request, request_id: str) -> None:
+        self.requests.append((request_id, request))
+
+    def execute(self) -> None:
+        self.service.api_calls += 1
+        for request_id, request in self.requests:
+            try:
+                response = request.factory()
+            except _HttpError as exc:
+                self.callback(request_id, None, exc)
+                continue
+            self.callback(request_id, response, None)
+
+
+@dataclass
+class FakeGmailService:
+    """In-memory stand-in for the ``googleapiclient`` Gmail service.
+
+    Supports ``messages().list`` (quoted order-number searches and paged
+    listing), ``messages().get`` in ``metadata``/``full`` format and batch
+    requests. Messages are generated on demand from ``mail_texts``.
+    """
+
+    orders: int
+    api_calls: int = 0
+
+    def users(self) -> "FakeGmailService":
+        return self
+
+    def messages(self) -> "FakeGmailService":
+        return self
+
+    def new_batch_http_request(self, callback) -> _Batch:
+        return _Batch(self, callback)
+
+    def _ids_for(self, index: int) -> list[str]:
+        return [f"{index:08d}-{mail}" for mail in range(len(mail_texts(index)))]
+
+    def list(self, userId: str, q: str, maxResults: int = 100, pageToken: str | None = None, **params):
+        def factory() -> dict:
+            terms = QUOTED_TERM_PATTERN.findall(q)
+            if terms:
+                index = _order_index(terms[0])
+                ids = self._ids_for(index) if index is not None and index < self.orders else []
+                return {"messages": [{"id": message_id} for message_id in ids[:maxResults]]}
+            start = int(pageToken or 0)
+            stop = min(start + maxResults, self.orders)
+            response = {
+                "messages": [
+                    {"id": message_id} for index in range(start, stop) for message_id in self._ids_for(index)
+                ]
+            }
+            if stop < self.orders:
+                response["nextPageToken"] = str(stop)
+            return response
+
+        return _Request(self, factory)
+
+    def get(self, userId: str, id: str, format: str = "full", **params):
+        def factory() -> dict:
+            index, mail = (int(part) for part in id.split("-"))
+            texts = mail_texts(index)
+            if index >= self.orders or mail >= len(texts):
+                raise _HttpError(404)
+            return gmail_message(
+                id, *texts[mail], format=format, metadata_headers=params.get("metadataHeaders")
+            )
+
+        return _Request(self, factory)
+
+
+def _order_index(number: str) -> int | None:
+    parts = number.split("-")
+    if len(parts) != 3:
+        return None
+    return (int(parts[2]) - 1000000) * 10_000_000 + int(parts[1])
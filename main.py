@@ -1,5 +1,9 @@
+from multiprocessing import freeze_support
+
 from order_sync.cli import main
 
 
 if __name__ == "__main__":
+    # PyInstaller で EXE 化した場合も複数アカウントのワーカープロセスを起動できるようにする
+    freeze_support()
     main()
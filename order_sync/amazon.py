@@ -1,20 +1,49 @@
 from __future__ import annotations
 
 import json
+import re
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable
-
-from bs4 import BeautifulSoup
-from dateutil import parser as date_parser
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.common.exceptions import WebDriverException
-from webdriver_manager.chrome import ChromeDriverManager
+from typing import TYPE_CHECKING, Iterable, Iterator
+from urllib.parse import urlencode
 
 from .models import Order, OrderItem
+from .profiling import RunProfile
+
+# selenium / webdriver-manager / bs4 は読み込みに時間がかかるため、使う処理の中で import する
+if TYPE_CHECKING:
+    from bs4 import SoupStrainer
+    from selenium import webdriver
+
+    from .archive import RunArchive
+
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:  # pragma: no cover - lxml is optional
+    HTML_PARSER = "html.parser"
+
+ORDER_CARD_SELECTOR = "div.a-box-group.a-spacing-base.order"
+PAGE_STRAINER_CLASS = re.compile(r"(?:^|\s)(?:order|a-pagination|a-last)(?:\s|$)")
+ORDER_DATE_PATTERN = re.compile(r"(\d{4})(?:年|/|-)(\d{1,2})(?:月|/|-)(\d{1,2})日?")
+ADDRESS_LABEL_PATTERN = re.compile("お届け先")
+# 注文履歴ページの読み込み完了とみなす要素 (注文カードまたはページ送り)
+READY_SELECTOR = f"{ORDER_CARD_SELECTOR}, ul.a-pagination, li.a-last"
+READY_SCRIPT = (
+    "return document.readyState === 'complete' || document.querySelector(arguments[0]) !== null;"
+)
+
+
+@lru_cache(maxsize=None)
+def _page_strainer() -> SoupStrainer:
+    from bs4 import SoupStrainer
+
+    # 注文カードとページ送り以外の要素は木を構築しない
+    return SoupStrainer(class_=PAGE_STRAINER_CLASS)
 
 
 @dataclass
@@ -23,25 +52,133 @@ class AmazonConfig:
     login_url: str = "https://www.amazon.co.jp/ap/signin"
     base_url: str = "https://www.amazon.co.jp"
     orders_url: str = "https://www.amazon.co.jp/gp/your-account/order-history"
+    # 注文履歴を年で絞り込むURLパラメータ (例: timeFilter=year-2023)
+    year_filter_param: str = "timeFilter"
+    # ページの準備完了を待つ上限秒数。要素が現れればその時点で待機を終える
     wait_seconds: float = 3.0
+    poll_seconds: float = 0.1
     driver_path: Path | None = None
+    # 自動取得した ChromeDriver のパスと対応する Chrome のバージョンを記録するファイル
+    driver_cache_file: Path | None = Path("chromedriver.json")
+    headless: bool = False
+    # 指定するとクッキーの再生ではなく Chrome のプロフィールでログイン状態を保持する
+    user_data_dir: Path | None = None
+    # 注文履歴の1ページあたりの注文数 (startIndex でページを直接開く際に使う)
+    orders_per_page: int = 10
+    # ドライバープールで同時に起動する Chrome の上限
+    max_drivers: int = 4
+
+
+@dataclass
+class HistoryPage:
+    orders: list[Order] = field(default_factory=list)
+    order_dates: list[datetime] = field(default_factory=list)
+    next_href: str | None = None
+    # 注文日を読み取れなかったものも含めた注文カードの数
+    cards: int = 0
+
+
+class PageSizeMismatch(RuntimeError):
+    """A history page holds a different number of orders than ``startIndex`` paging assumes."""
+
+
+def check_page_size(page: HistoryPage, orders_per_page: int) -> None:
+    """Raise ``PageSizeMismatch`` if a page with a next link does not hold ``orders_per_page`` cards.
+
+    Fetchers that open page ``index`` at ``startIndex = index * orders_per_page``
+    would otherwise skip or repeat orders without noticing.
+    """
+    if page.next_href and page.cards != orders_per_page:
+        raise PageSizeMismatch(
+            f"注文履歴の1ページあたりの注文数が {page.cards} 件で、"
+            f"想定 ({orders_per_page} 件) と異なります。"
+        )
 
 
 class AmazonOrderFetcher:
     """Fetch order information from Amazon order history using Selenium."""
 
-    def __init__(self, config: AmazonConfig | None = None):
+    def __init__(
+        self,
+        config: AmazonConfig | None = None,
+        profile: RunProfile | None = None,
+        archive: RunArchive | None = None,
+    ):
         self.config = config or AmazonConfig()
+        self.profile = profile or RunProfile()
+        # 指定すると取得したページの HTML を記録する (--record)
+        self.archive = archive
+        self.page_load_times: list[float] = []
+        self._profile_reused = False
+
+    @staticmethod
+    def _browser_version() -> str | None:
+        try:
+            from webdriver_manager.core.os_manager import ChromeType, OperationSystemManager
+
+            return OperationSystemManager().get_browser_version_from_os(ChromeType.GOOGLE)
+        except Exception:  # pragma: no cover - depends on the local Chrome install
+            return None
+
+    def _resolve_driver_binary(self) -> tuple[Path, bool]:
+        """Return the ChromeDriver to use and whether it came from the local driver cache.
+
+        The path resolved by webdriver-manager is pinned to the installed Chrome
+        version, so later runs skip the online version check until Chrome changes.
+        """
+        if self.config.driver_path is not None:
+            return Path(self.config.driver_path), False
+
+        cache_file = self.config.driver_cache_file
+        browser_version = self._browser_version()
+        if cache_file is not None and cache_file.exists():
+            try:
+                with cache_file.open("r", encoding="utf-8") as handle:
+                    cached = json.load(handle)
+            except (OSError, ValueError):
+                cached = {}
+            cached_path = Path(cached.get("path", ""))
+            if (
+                cached.get("path")
+                and cached_path.exists()
+                and cached.get("chrome_version") == browser_version
+            ):
+                return cached_path, True
+
+        from webdriver_manager.chrome import ChromeDriverManager
+
+        driver_binary = Path(ChromeDriverManager().install())
+        if cache_file is not None:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with cache_file.open("w", encoding="utf-8") as handle:
+                json.dump(
+                    {"path": str(driver_binary), "chrome_version": browser_version},
+                    handle,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+        return driver_binary, False
 
     def _create_driver(self) -> webdriver.Chrome:
-        options = webdriver.ChromeOptions()
-        options.add_argument("--start-maximized")
-        driver_binary = (
+        from selenium import webdriver
+        from selenium.common.exceptions import WebDriverException
+        from selenium.webdriver.chrome.service import Service
 
-            Path(self.config.driver_path)
-            if self.config.driver_path is not None
-            else Path(ChromeDriverManager().install())
-        )
+        options = webdriver.ChromeOptions()
+        if self.config.headless:
+            options.add_argument("--headless=new")
+            options.add_argument("--window-size=1920,1080")
+            options.add_argument("--blink-settings=imagesEnabled=false")
+        else:
+            options.add_argument("--start-maximized")
+        profile = self.config.user_data_dir
+        if profile is not None:
+            profile = Path(profile).resolve()
+            self._profile_reused = profile.is_dir() and any(profile.iterdir())
+            options.add_argument(f"--user-data-dir={profile}")
+        # DOMContentLoaded で制御を戻し、以降は _wait_for_page で必要な要素を待つ
+        options.page_load_strategy = "eager"
+        driver_binary, from_cache = self._resolve_driver_binary()
         if not driver_binary.exists():
             raise RuntimeError(
                 "指定された ChromeDriver が見つかりませんでした。"
@@ -53,6 +190,9 @@ class AmazonOrderFetcher:
                 options=options,
             )
         except (OSError, WebDriverException) as exc:
+            if from_cache and self.config.driver_cache_file is not None:
+                # 記録済みのドライバーが使えなくなった場合は次回に取得し直す
+                self.config.driver_cache_file.unlink(missing_ok=True)
             if self.config.driver_path is None:
                 guidance = (
                     "自動ダウンロードされたバイナリが環境に対応していない可能性があります。"
@@ -68,25 +208,13 @@ class AmazonOrderFetcher:
                 f"使用したバイナリ: {driver_binary}\n"
                 f"{guidance}\n"
                 f"詳細: {exc}"
-
-            str(self.config.driver_path)
-            if self.config.driver_path is not None
-            else ChromeDriverManager().install()
-        )
-        try:
-            driver = webdriver.Chrome(
-                service=Service(driver_binary),
-                options=options,
-            )
-        except OSError as exc:
-            raise RuntimeError(
-                "ChromeDriver の起動に失敗しました。自動ダウンロードされたバイナリが環境に対応していない可能性があります。 "
-                "ChromeDriver を手動でダウンロードし、AmazonConfig.driver_path もしくは --chrome-driver オプションでパスを指定してください。"
-
             ) from exc
         return driver
 
     def _load_cookies(self, driver: webdriver.Chrome) -> None:
+        if self._profile_reused:
+            # 既存のプロフィールがログイン状態を保持しているため、クッキーの再生は不要
+            return
         if self.config.cookie_file.exists():
             driver.get(self.config.base_url)
             with self.config.cookie_file.open("r", encoding="utf-8") as handle:
@@ -94,99 +222,202 @@ class AmazonOrderFetcher:
             for cookie in cookies:
                 cookie = {k: v for k, v in cookie.items() if k != "sameSite"}
                 driver.add_cookie(cookie)
+            started = time.perf_counter()
             driver.refresh()
-            time.sleep(self.config.wait_seconds)
+            self._wait_for_page(driver, started)
 
     def _save_cookies(self, driver: webdriver.Chrome) -> None:
         cookies = driver.get_cookies()
         with self.config.cookie_file.open("w", encoding="utf-8") as handle:
             json.dump(cookies, handle, ensure_ascii=False, indent=2)
 
-    def _ensure_logged_in(self, driver: webdriver.Chrome) -> None:
-        driver.get(self.config.orders_url)
-        time.sleep(self.config.wait_seconds)
+    def _wait_for_page(self, driver: webdriver.Chrome, started: float) -> float:
+        """Wait until order cards or pagination appear (or the page finishes loading).
+
+        Returns the latency since ``started`` and records it in ``page_load_times``.
+        """
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        try:
+            WebDriverWait(
+                driver, self.config.wait_seconds, poll_frequency=self.config.poll_seconds
+            ).until(lambda current: current.execute_script(READY_SCRIPT, READY_SELECTOR))
+        except TimeoutException:
+            pass
+        elapsed = time.perf_counter() - started
+        self.page_load_times.append(elapsed)
+        self.profile.add_time("page_load", elapsed)
+        return elapsed
+
+    def _navigate(self, driver: webdriver.Chrome, url: str) -> float:
+        started = time.perf_counter()
+        driver.get(url)
+        return self._wait_for_page(driver, started)
+
+    def _ensure_logged_in(self, driver: webdriver.Chrome, url: str | None = None) -> bool:
+        """Open ``url`` (the orders page by default) and make sure the session is signed in.
+
+        Returns True when the page is still loaded afterwards, so the caller
+        can parse it instead of loading it again.
+        """
+        self._navigate(driver, url or self.config.orders_url)
         if "signin" in driver.current_url:
+            if self.config.headless:
+                raise RuntimeError(
+                    "Amazonのログインが必要ですが、ヘッドレスモードではログインできません。"
+                    "一度ヘッドレスモードを使わずに実行してログインしてください。"
+                )
             print("Amazonにログインしてください。ログイン完了後にEnterキーを押してください。")
             input()
             self._save_cookies(driver)
-        else:
-            self._save_cookies(driver)
+            return False
+        self._save_cookies(driver)
+        return True
 
     def _parse_orders(self, html: str, start_date: datetime, end_date: datetime) -> Iterable[Order]:
-        soup = BeautifulSoup(html, "html.parser")
-        cards = soup.select("div.a-box-group.a-spacing-base.order")
-        for card in cards:
-            order_date_element = card.select_one("span.order-date-invoice-item")
-            if not order_date_element:
-                continue
-            order_date_text = order_date_element.get_text(strip=True)
-            order_date = date_parser.parse(order_date_text.replace("注文日", "").strip())
-            if not (start_date <= order_date <= end_date):
-                continue
+        return iter(self.parse_page(html, start_date, end_date).orders)
 
-            order_number_el = card.select_one("span.value")
-            order_number = order_number_el.get_text(strip=True) if order_number_el else ""
-
-            price_el = card.select_one("span.value > span.a-color-price")
-            price = price_el.get_text(strip=True) if price_el else ""
-
-            arrival_el = card.select_one("div.a-row.a-size-base.a-color-secondary")
-            arrival_raw = arrival_el.get_text(strip=True) if arrival_el else ""
-
-            delivery_name = ""
-            delivery_address = ""
-            address_block = card.find("div", string=lambda text: text and "お届け先" in text)
-            if address_block:
-                parent = address_block.find_parent("div")
-                if parent:
-                    lines = parent.get_text("\n", strip=True).splitlines()
-                    if len(lines) >= 2:
-                        delivery_name = lines[1]
-                    if len(lines) >= 3:
-                        delivery_address = " ".join(lines[2:])
-
-            items = []
-            item_rows = card.select("div.a-fixed-left-grid")
-            for row in item_rows:
-                link = row.select_one("a.a-link-normal")
-                if not link:
+    def parse_page(self, html: str, start_date: datetime, end_date: datetime) -> HistoryPage:
+        """Parse a history page once: orders in the window, every card date and the next-page link."""
+        with self.profile.stage("html_parse"):
+            from bs4 import BeautifulSoup
+
+            soup = BeautifulSoup(html, HTML_PARSER, parse_only=_page_strainer())
+            page = HistoryPage()
+            for card in soup.select(ORDER_CARD_SELECTOR):
+                page.cards += 1
+                order_date = self._parse_order_date(card)
+                if order_date is None:
                     continue
-                title = link.get_text(strip=True)
-                qty_el = row.select_one("span.item-view-qty")
-                quantity = qty_el.get_text(strip=True) if qty_el else "1"
-                items.append(OrderItem(title=title, quantity=quantity))
-
-            yield Order(
-                order_date=order_date,
-                order_number=order_number,
-                price=price,
-                arrival_raw=arrival_raw,
-                delivery_name=delivery_name,
-                delivery_address=delivery_address,
-                items=items,
-            )
+                page.order_dates.append(order_date)
+                if not (start_date <= order_date <= end_date):
+                    continue
+                page.orders.append(self._parse_card(card, order_date))
 
-    def fetch_orders(self, start_date: datetime, end_date: datetime) -> list[Order]:
-        driver = self._create_driver()
-        self._load_cookies(driver)
-        self._ensure_logged_in(driver)
+            next_button = soup.select_one("li.a-last a")
+            if next_button:
+                page.next_href = next_button.get("href")
+        self.profile.count("pages")
+        self.profile.count("orders", len(page.orders))
+        self.profile.count("items", sum(len(order.items) for order in page.orders))
+        return page
 
-        orders: list[Order] = []
+    @staticmethod
+    def _parse_card(card, order_date: datetime) -> Order:
+        order_number_el = card.select_one("span.value")
+        order_number = order_number_el.get_text(strip=True) if order_number_el else ""
+
+        price_el = card.select_one("span.value > span.a-color-price")
+        price = price_el.get_text(strip=True) if price_el else ""
+
+        arrival_el = card.select_one("div.a-row.a-size-base.a-color-secondary")
+        arrival_raw = arrival_el.get_text(strip=True) if arrival_el else ""
+
+        delivery_name = ""
+        delivery_address = ""
+        address_block = AmazonOrderFetcher._find_address_block(card)
+        if address_block:
+            parent = address_block.find_parent("div")
+            if parent:
+                lines = parent.get_text("\n", strip=True).splitlines()
+                if len(lines) >= 2:
+                    delivery_name = lines[1]
+                if len(lines) >= 3:
+                    delivery_address = " ".join(lines[2:])
+
+        items = []
+        for row in card.select("div.a-fixed-left-grid"):
+            link = row.select_one("a.a-link-normal")
+            if not link:
+                continue
+            title = link.get_text(strip=True)
+            qty_el = row.select_one("span.item-view-qty")
+            quantity = qty_el.get_text(strip=True) if qty_el else "1"
+            items.append(OrderItem(title=title, quantity=quantity))
+
+        return Order(
+            order_date=order_date,
+            order_number=order_number,
+            price=price,
+            arrival_raw=arrival_raw,
+            delivery_name=delivery_name,
+            delivery_address=delivery_address,
+            items=items,
+        )
+
+    @staticmethod
+    def _find_address_block(card):
+        # 「お届け先」を含むテキストから遡り、そのテキストだけを持つ最も外側の div を探す
+        # (card.find("div", string=...) と同じ要素を、全 div の走査なしで得る)
+        for text in card.find_all(string=ADDRESS_LABEL_PATTERN):
+            block = None
+            node = text.parent
+            while node is not None and node is not card and node.string is text:
+                if node.name == "div":
+                    block = node
+                node = node.parent
+            if block is not None:
+                return block
+        return None
+
+    @staticmethod
+    def _parse_order_date(card) -> datetime | None:
+        order_date_element = card.select_one("span.order-date-invoice-item")
+        if not order_date_element:
+            return None
+        order_date_text = order_date_element.get_text(strip=True).replace("注文日", "").strip()
+        match = ORDER_DATE_PATTERN.fullmatch(order_date_text)
+        if match:
+            return datetime(*map(int, match.groups()))
+        from dateutil import parser as date_parser
+
+        return date_parser.parse(order_date_text)
+
+    def _year_url(self, year: int, start_index: int = 0) -> str:
+        query: dict[str, str | int] = {self.config.year_filter_param: f"year-{year}"}
+        if start_index:
+            # 年フィルター内の注文の通し番号で、途中のページを直接開く
+            query["startIndex"] = start_index
+        return f"{self.config.orders_url}?{urlencode(query)}"
+
+    def iter_pages(self, start_date: datetime, end_date: datetime) -> Iterator[list[Order]]:
+        """Yield the orders parsed from each history page as soon as it is loaded.
+
+        History is newest-first, so each year in the window is opened directly
+        through the year filter, and paging stops once a page reaches orders
+        older than ``start_date``.
+        """
+        with self.profile.stage("chrome_start"):
+            driver = self._create_driver()
         try:
-            driver.get(self.config.orders_url)
-            time.sleep(self.config.wait_seconds)
-
-            while True:
-                orders.extend(self._parse_orders(driver.page_source, start_date, end_date))
-                soup = BeautifulSoup(driver.page_source, "html.parser")
-                next_button = soup.select_one("li.a-last a")
-                if next_button:
-                    href = next_button.get("href")
-                    if href:
-                        driver.get(f"{self.config.base_url}{href}")
-                        time.sleep(self.config.wait_seconds)
-                        continue
-                break
+            self._load_cookies(driver)
+            # ログイン確認で開いたページを最初の履歴ページとしてそのまま使う
+            page_ready = self._ensure_logged_in(driver, self._year_url(end_date.year))
+
+            for year in range(end_date.year, start_date.year - 1, -1):
+                if not (page_ready and year == end_date.year):
+                    self._navigate(driver, self._year_url(year))
+                index = 0
+                while True:
+                    html = driver.page_source
+                    self.profile.count("amazon_bytes", len(html.encode("utf-8")))
+                    if self.archive is not None:
+                        self.archive.put_page(year, index, html)
+                    page = self.parse_page(html, start_date, end_date)
+                    yield page.orders
+                    if page.order_dates and min(page.order_dates) < start_date:
+                        return
+                    if not page.next_href:
+                        break
+                    self._navigate(driver, f"{self.config.base_url}{page.next_href}")
+                    index += 1
         finally:
             driver.quit()
-        return orders
+
+    def iter_orders(self, start_date: datetime, end_date: datetime) -> Iterator[Order]:
+        for page in self.iter_pages(start_date, end_date):
+            yield from page
+
+    def fetch_orders(self, start_date: datetime, end_date: datetime) -> list[Order]:
+        return list(self.iter_orders(start_date, end_date))
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator
+
+from .amazon import AmazonConfig, AmazonOrderFetcher
+from .models import Order
+from .profiling import RunProfile
+
+# テーブル定義を変更したら上げる。形式の異なるアーカイブは再生しない
+SCHEMA_VERSION = 1
+COMPRESSION_LEVEL = 6
+
+
+class ArchiveMissing(RuntimeError):
+    """Replay needed a history page or Gmail response that the archive does not contain."""
+
+
+class RunArchive:
+    """Compressed record of the Amazon history pages and Gmail API responses of one run.
+
+    Pages are keyed by year and page index within the year filter, so the
+    Selenium, HTTP and driver-pool fetchers record the same keys. Gmail
+    responses are keyed by API method and parameters. Every value is stored
+    zlib-compressed in one SQLite file. ``mode="w"`` starts a new recording
+    and discards the previous contents; ``mode="r"`` opens it read-only.
+    """
+
+    def __init__(self, path: Path, mode: str = "r"):
+        self.path = path
+        self.writable = mode == "w"
+        self._lock = threading.Lock()
+        if self.writable:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            with self._connection:
+                for table in ("meta", "pages", "responses"):
+                    self._connection.execute(f"DROP TABLE IF EXISTS {table}")
+                self._connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                self._connection.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+                self._connection.execute(
+                    "CREATE TABLE pages (year INTEGER NOT NULL, page INTEGER NOT NULL, "
+                    "size INTEGER NOT NULL, html BLOB NOT NULL, PRIMARY KEY (year, page))"
+                )
+                self._connection.execute(
+                    "CREATE TABLE responses (key TEXT PRIMARY KEY, status INTEGER, "
+                    "size INTEGER NOT NULL, body BLOB)"
+                )
+        else:
+            self._connection = sqlite3.connect(
+                f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False
+            )
+            (version,) = self._connection.execute("PRAGMA user_version").fetchone()
+            if version != SCHEMA_VERSION:
+                self._connection.close()
+                raise RuntimeError(f"{self.path} は再生できない形式のアーカイブです。")
+
+    @staticmethod
+    def _compress(text: str) -> tuple[int, bytes]:
+        data = text.encode("utf-8")
+        return len(data), zlib.compress(data, COMPRESSION_LEVEL)
+
+    @staticmethod
+    def _decompress(blob: bytes) -> str:
+        return zlib.decompress(blob).decode("utf-8")
+
+    def put_meta(self, **values: str) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", list(values.items())
+            )
+
+    def meta(self) -> dict[str, str]:
+        with self._lock:
+            return dict(self._connection.execute("SELECT name, value FROM meta"))
+
+    def put_page(self, year: int, index: int, html: str) -> None:
+        size, blob = self._compress(html)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pages (year, page, size, html) VALUES (?, ?, ?, ?)",
+                (year, index, size, blob),
+            )
+
+    def page(self, year: int, index: int) -> str | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT html FROM pages WHERE year = ? AND page = ?", (year, index)
+            ).fetchone()
+        return self._decompress(row[0]) if row is not None else None
+
+    def put_response(self, key: str, response: dict | None, status: int | None = None) -> None:
+        """Store a successful ``response``, or the HTTP ``status`` of a request that failed for good."""
+        size, blob = 0, None
+        if response is not None:
+            size, blob = self._compress(json.dumps(response, ensure_ascii=False))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, status, size, body) VALUES (?, ?, ?, ?)",
+                (key, status, size, blob),
+            )
+
+    def response(self, key: str) -> tuple[dict | None, int | None]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT body, status FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            raise ArchiveMissing(
+                f"アーカイブに記録されていないGmail APIの呼び出しです: {key}\n"
+                "記録したときと同じ期間・オプションで再生してください。"
+            )
+        body, status = row
+        return (json.loads(self._decompress(body)) if body is not None else None), status
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            pages, page_size, page_stored = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(html)), 0) FROM pages"
+            ).fetchone()
+            responses, response_size, response_stored = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(body)), 0) FROM responses"
+            ).fetchone()
+        return {
+            "pages": pages,
+            "responses": responses,
+            "raw_bytes": page_size + response_size,
+            "stored_bytes": page_stored + response_stored,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self.writable:
+                # 持ち運べるよう、WAL を書き戻して空き領域を詰めた1つのファイルにまとめる
+                self._connection.execute("PRAGMA journal_mode=DELETE")
+                self._connection.execute("VACUUM")
+            self._connection.close()
+
+
+def _request_key(method: str, params: dict[str, Any]) -> str:
+    return json.dumps(
+        [method, {name: value for name, value in params.items() if value is not None}],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+
+
+def _http_status(exception: BaseException | None) -> int | None:
+    return getattr(getattr(exception, "resp", None), "status", None)
+
+
+class _RecordingRequest:
+    def __init__(self, request: Any, archive: RunArchive, key: str):
+        self.request = request
+        self.archive = archive
+        self.key = key
+
+    def execute(self, **params: Any) -> dict:
+        try:
+            response = self.request.execute(**params)
+        except Exception as exc:
+            if _http_status(exc) == 404:
+                self.archive.put_response(self.key, None, 404)
+            raise
+        self.archive.put_response(self.key, response)
+        return response
+
+
+class _RecordingBatch:
+    def __init__(self, service: Any, archive: RunArchive, callback: Callable[..., None]):
+        self.archive = archive
+        self.keys: dict[str, str] = {}
+
+        def record(request_id: str, response: dict, exception: Exception | None) -> None:
+            if exception is None:
+                archive.put_response(self.keys[request_id], response)
+            elif _http_status(exception) == 404:
+                archive.put_response(self.keys[request_id], None, 404)
+            callback(request_id, response, exception)
+
+        self.batch = service.new_batch_http_request(callback=record)
+
+    def add(self, request: _RecordingRequest, request_id: str) -> None:
+        self.keys[request_id] = request.key
+        self.batch.add(request.request, request_id=request_id)
+
+    def execute(self) -> None:
+        self.batch.execute()
+
+
+class RecordingGmailService:
+    """Wrap a Gmail API service and store every response in ``archive``.
+
+    Retryable errors are not stored, since the request is sent again;
+    404s are, so replay drops the same deleted messages.
+    """
+
+    def __init__(self, resource: Any, archive: RunArchive, method: str = ""):
+        self.resource = resource
+        self.archive = archive
+        self.method = method
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        attribute = getattr(self.resource, name)
+        method = f"{self.method}.{name}" if self.method else name
+
+        def call(**params: Any) -> Any:
+            result = attribute(**params)
+            if hasattr(result, "execute"):
+                return _RecordingRequest(result, self.archive, _request_key(method, params))
+            return RecordingGmailService(result, self.archive, method)
+
+        return call
+
+    def new_batch_http_request(self, callback: Callable[..., None]) -> _RecordingBatch:
+        return _RecordingBatch(self.resource, self.archive, callback)
+
+
+class ReplayHttpError(Exception):
+    """A recorded API error, shaped like ``googleapiclient.errors.HttpError`` where the client looks."""
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.resp = SimpleNamespace(status=status)
+
+
+class _ReplayRequest:
+    def __init__(self, archive: RunArchive, key: str):
+        self.archive = archive
+        self.key = key
+
+    def execute(self, **params: Any) -> dict:
+        response, status = self.archive.response(self.key)
+        if status is not None:
+            raise ReplayHttpError(status)
+        return response
+
+
+class _ReplayBatch:
+    def __init__(self, callback: Callable[..., None]):
+        self.callback = callback
+        self.requests: list[tuple[str, _ReplayRequest]] = []
+
+    def add(self, request: _ReplayRequest, request_id: str) -> None:
+        self.requests.append((request_id, request))
+
+    def execute(self) -> None:
+        for request_id, request in self.requests:
+            try:
+                response = request.execute()
+            except ReplayHttpError as exc:
+                self.callback(request_id, None, exc)
+                continue
+            self.callback(request_id, response, None)
+
+
+class ReplayGmailService:
+    """Answer the Gmail API calls of ``GmailClient`` from a recorded archive, without network access."""
+
+    def __init__(self, archive: RunArchive, method: str = ""):
+        self.archive = archive
+        self.method = method
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        method = f"{self.method}.{name}" if self.method else name
+
+        def call(**params: Any) -> Any:
+            # users() / messages() などのリソースは引数なし、API呼び出しは userId などの引数付きで呼ばれる
+            if not params:
+                return ReplayGmailService(self.archive, method)
+            return _ReplayRequest(self.archive, _request_key(method, params))
+
+        return call
+
+    def new_batch_http_request(self, callback: Callable[..., None]) -> _ReplayBatch:
+        return _ReplayBatch(callback)
+
+
+class ArchiveOrderFetcher:
+    """Yield the orders of recorded history pages, in the same order as ``AmazonOrderFetcher``."""
+
+    def __init__(
+        self,
+        archive: RunArchive,
+        config: AmazonConfig | None = None,
+        profile: RunProfile | None = None,
+    ):
+        self.archive = archive
+        self.config = config or AmazonConfig()
+        self.profile = profile or RunProfile()
+        self.parser = AmazonOrderFetcher(self.config, profile=self.profile)
+        self.page_load_times: list[float] = []
+
+    def iter_pages(self, start_date: datetime, end_date: datetime) -> Iterator[list[Order]]:
+        for year in range(end_date.year, start_date.year - 1, -1):
+            index = 0
+            while True:
+                html = self.archive.page(year, index)
+                if html is None:
+                    raise ArchiveMissing(
+                        f"アーカイブに {year} 年の注文履歴の {index + 1} ページ目がありません。"
+                        "記録した期間の範囲内で再生してください。"
+                    )
+                self.profile.count("amazon_bytes", len(html.encode("utf-8")))
+                page = self.parser.parse_page(html, start_date, end_date)
+                yield page.orders
+                if page.order_dates and min(page.order_dates) < start_date:
+                    return
+                # 記録時の AmazonOrderFetcher.iter_pages と同じ条件で次のページへ進む
+                if not page.next_href:
+                    break
+                index += 1
+
+    def iter_orders(self, start_date: datetime, end_date: datetime) -> Iterator[Order]:
+        for page in self.iter_pages(start_date, end_date):
+            yield from page
+
+    def fetch_orders(self, start_date: datetime, end_date: datetime) -> list[Order]:
+        return list(self.iter_orders(start_date, end_date))
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import calendar
+import re
+from datetime import date, timedelta
+from functools import lru_cache
+
+ARRIVAL_KEYWORDS = (
+    ("お届け済み", "到着済"),
+    ("配達済み", "到着済"),
+    ("お届け予定", "到着予定"),
+    ("配達予定", "到着予定"),
+)
+
+# Amazon の表示で使われる日付表記 (2024年10月16日, 2024/10/16, 10月16日, 10/16)
+EXPLICIT_DATE_PATTERN = re.compile(
+    r"(?<!\d)(?:(\d{4})\s*[年/.\-]\s*(\d{1,2})\s*[月/.\-]\s*(\d{1,2})"
+    r"|(\d{1,2})\s*[月/]\s*(\d{1,2}))(?!\d)"
+)
+ENGLISH_DATE_PATTERN = re.compile(
+    r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+(\d{1,2})(?!\d)",
+    re.IGNORECASE,
+)
+ENGLISH_MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+WEEKDAY_PATTERN = re.compile("([月火水木金土日])曜")
+WEEKDAYS = "月火水木金土日"
+RELATIVE_DAYS = (("明後日", 2), ("明日", 1), ("今日", 0), ("本日", 0))
+
+
+class ArrivalParser:
+    """Turn Amazon's arrival text into "M月D日到着済" / "M月D日到着予定".
+
+    Relative forms (明日, 金曜日, ...) are resolved against one reference date
+    for the whole run, and results are memoized because the same arrival
+    strings repeat across many orders.
+    """
+
+    def __init__(self, today: date | None = None, cache_size: int = 4096):
+        self.today = today or date.today()
+        self.format = lru_cache(maxsize=cache_size)(self._format)
+
+    def _format(self, text: str) -> str:
+        text = (text or "").strip()
+        if not text:
+            return "不明"
+
+        normalized = text.replace("までにお届け", "にお届け")
+        for keyword, replacement in ARRIVAL_KEYWORDS:
+            if keyword in normalized:
+                normalized = normalized.replace("にお届け済み", "到着済")
+                normalized = normalized.replace(keyword, replacement)
+                break
+
+        explicit_date = self._extract_explicit_date(normalized)
+        if explicit_date:
+            month, day = explicit_date
+            suffix = "到着済" if "到着済" in normalized else "到着予定"
+            return f"{month}月{day}日{suffix}"
+
+        relative = self._resolve_relative_date(normalized)
+        if relative:
+            return f"{relative.month}月{relative.day}日到着予定"
+
+        if "到着" in normalized:
+            return normalized
+        return "不明"
+
+    @staticmethod
+    def _extract_explicit_date(text: str) -> tuple[int, int] | None:
+        for match in EXPLICIT_DATE_PATTERN.finditer(text):
+            year, month, day = (
+                (match[1], match[2], match[3]) if match[1] else (None, match[4], match[5])
+            )
+            if _is_valid_day(int(year) if year else None, int(month), int(day)):
+                return int(month), int(day)
+        for match in ENGLISH_DATE_PATTERN.finditer(text):
+            month = ENGLISH_MONTHS.index(match[1].lower()) + 1
+            if _is_valid_day(None, month, int(match[2])):
+                return month, int(match[2])
+        return None
+
+    def _resolve_relative_date(self, text: str) -> date | None:
+        for label, days in RELATIVE_DAYS:
+            if label in text:
+                return self.today + timedelta(days=days)
+
+        weekdays = [WEEKDAYS.index(label) for label in WEEKDAY_PATTERN.findall(text)]
+        if weekdays:
+            return self._next_weekday(self.today, min(weekdays))
+        return None
+
+    @staticmethod
+    def _next_weekday(base: date, weekday: int) -> date:
+        days_ahead = (weekday - base.weekday()) % 7
+        if days_ahead == 0:
+            days_ahead = 7
+        return base + timedelta(days=days_ahead)
+
+
+def _is_valid_day(year: int | None, month: int, day: int) -> bool:
+    # 年の記載がない場合は、うるう年の2月29日も受け付ける
+    return 1 <= month <= 12 and 1 <= day <= calendar.monthrange(year or 2000, month)[1]
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .models import OrderRecord
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def month_shards(start: datetime, end: datetime) -> list[str]:
+    """Return the months (``YYYY-MM``) that overlap the window, newest first like the order history."""
+    months: list[str] = []
+    year, month = end.year, end.month
+    while (year, month) >= (start.year, start.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return months
+
+
+def _month_start(month: str) -> datetime:
+    return datetime.strptime(month, "%Y-%m")
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class ShardCheckpoint:
+    """Records of each finished month of a long run, saved as soon as the month is complete.
+
+    Order history arrives newest first, so a month is complete once the
+    first order of an older month shows up. Its records and counts are
+    committed in one transaction; a crash loses at most the month in
+    progress. With ``resume``, finished months are replayed from the file
+    and only the older remainder of the window is fetched again.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        start: datetime,
+        end: datetime,
+        resume: bool = False,
+        label: str = "",
+    ):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.label = label
+        self.months = month_shards(start, end)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.path))
+        window = {"start_date": start.strftime(DATE_FORMAT), "end_date": end.strftime(DATE_FORMAT)}
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS shards ("
+                "month TEXT PRIMARY KEY, orders INTEGER NOT NULL, rows INTEGER NOT NULL, "
+                "completed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                "month TEXT NOT NULL, seq INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (month, seq))"
+            )
+            stored = dict(self._connection.execute("SELECT name, value FROM meta"))
+            if resume and stored and stored != window:
+                raise RuntimeError(
+                    f"チェックポイント {self.path} の期間 ({stored['start_date']} 〜 {stored['end_date']}) が"
+                    "指定した期間と異なります。--resume を外して最初から実行してください。"
+                )
+            if not resume or not stored:
+                self._connection.execute("DELETE FROM shards")
+                self._connection.execute("DELETE FROM records")
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", list(window.items())
+                )
+        self.completed: dict[str, int] = {
+            month: orders for month, orders in self._connection.execute("SELECT month, orders FROM shards")
+        }
+
+    def pending_end(self) -> datetime | None:
+        """Return the end of the part of the window still to fetch, or None when every month is done."""
+        done = [month for month in self.months if month in self.completed]
+        if not done:
+            return self.end
+        # 完了済みの月は新しい側から連続しているため、最も古い完了月の前日までが残り
+        pending_end = min(self.end, _month_start(done[-1]) - timedelta(days=1))
+        return pending_end if pending_end >= self.start else None
+
+    def _completed_records(self) -> Iterator[OrderRecord]:
+        previous: OrderRecord | None = None
+        for month in self.months:
+            if month not in self.completed:
+                continue
+            for (data,) in self._connection.execute(
+                "SELECT data FROM records WHERE month = ? ORDER BY seq", (month,)
+            ):
+                previous = OrderRecord.from_dict(json.loads(data), previous)
+                yield previous
+
+    def _complete(self, month: str, records: list[OrderRecord]) -> int:
+        orders = len({record.order_number for record in records})
+        with self._connection:
+            self._connection.execute("DELETE FROM records WHERE month = ?", (month,))
+            self._connection.executemany(
+                "INSERT INTO records (month, seq, data) VALUES (?, ?, ?)",
+                [
+                    (month, seq, json.dumps(record.as_dict(), ensure_ascii=False))
+                    for seq, record in enumerate(records)
+                ],
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO shards (month, orders, rows, completed_at) VALUES (?, ?, ?, ?)",
+                (month, orders, len(records), time.time()),
+            )
+        self.completed[month] = orders
+        return orders
+
+    def track(self, records: Iterable[OrderRecord]) -> Iterator[OrderRecord]:
+        """Yield the saved records of finished months, then ``records`` while checkpointing each month.
+
+        The file is closed once the records are exhausted or the run fails.
+        """
+        try:
+            yield from self._track(records)
+        finally:
+            self.close()
+
+    def _track(self, records: Iterable[OrderRecord]) -> Iterator[OrderRecord]:
+        reused = sum(self.completed.get(month, 0) for month in self.months)
+        if self.completed:
+            print(
+                f"{self.label}チェックポイントから {len(self.completed)} か月分 ({reused:,} 件) の注文を再利用します。"
+            )
+        yield from self._completed_records()
+
+        pending_end = self.pending_end()
+        if pending_end is None:
+            return
+        total_days = (pending_end - self.start).days + 1
+        started = time.monotonic()
+        fetched = 0
+        month: str | None = None
+        rows: list[OrderRecord] = []
+
+        def finish(through: str | None) -> None:
+            # through より新しい未完了の月 (注文のない月を含む) をすべて完了にする
+            nonlocal fetched, rows
+            for shard in self.months:
+                if shard in self.completed or (through is not None and shard <= through):
+                    continue
+                orders = self._complete(shard, rows if shard == month else [])
+                fetched += orders
+                elapsed = time.monotonic() - started
+                done_days = min(total_days, (pending_end - max(self.start, _month_start(shard))).days + 1)
+                eta = elapsed * (total_days - done_days) / done_days if done_days > 0 else 0.0
+                print(
+                    f"{self.label}{shard} 完了: {orders:,} 件 | 累計 {fetched:,} 件"
+                    f" ({fetched / elapsed if elapsed > 0 else 0.0:.1f} 件/秒)"
+                    f" | 進捗 {done_days / total_days:.0%} | 残り約 {_format_duration(eta)}"
+                )
+            rows = []
+
+        try:
+            for record in records:
+                record_month = record.order_date[:7]
+                if month is not None and record_month != month:
+                    finish(record_month)
+                month = record_month
+                rows.append(record)
+                yield record
+            finish(None)
+        except BaseException:
+            if self.completed:
+                print(
+                    f"{self.label}完了した {len(self.completed)} か月分は {self.path} に保存されています。"
+                    "--resume を付けて再実行すると続きから取得します。"
+                )
+            raise
+
+    def close(self) -> None:
+        self._connection.close()
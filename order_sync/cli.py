@@ -1,25 +1,113 @@
 from __future__ import annotations
 
 import argparse
-from datetime import datetime
+import cProfile
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime
+from itertools import chain
 from pathlib import Path
-from typing import Any, Sequence
+from typing import Any, Iterator, Sequence
 
 import tomllib
 
 from .amazon import AmazonConfig, AmazonOrderFetcher
+from .archive import ArchiveMissing, ArchiveOrderFetcher, ReplayGmailService, RunArchive
+from .checkpoint import ShardCheckpoint
 from .csv_writer import CsvWriter
+from .driver_pool import DriverPoolFetcher
 from .gmail_client import GmailClient, GmailConfig, StatusDetector
+from .http_fetcher import HttpOrderFetcher
+from .jsonl_writer import JsonlWriter
+from .models import OrderRecord
+from .pipeline import iter_pipelined
 from .processing import OrderProcessor
+from .profiling import RunProfile
+from .sqlite_writer import SqliteWriter
+from .state_store import OrderStateStore
+from .watch import MailboxWatcher
 
 DATE_FORMAT = "%Y-%m-%d"
 DEFAULT_CONFIG_FILE = Path("config.toml")
+DEFAULT_CHROME_PROFILE = Path("chrome-profile")
+DEFAULT_PROFILE_REPORT = Path("profile.json")
+DEFAULT_CHECKPOINT = Path("checkpoint.sqlite3")
+# 出力形式ごとの既定の拡張子と、拡張子から形式を判定する対応表
+OUTPUT_SUFFIXES = {"csv": ".csv", "sqlite": ".sqlite3", "jsonl": ".jsonl"}
+OUTPUT_FORMATS = {".csv": "csv", ".sqlite3": "sqlite", ".sqlite": "sqlite", ".db": "sqlite", ".jsonl": "jsonl"}
+# [[accounts]] でファイルを指定しなかった場合の保存先 (設定ファイルからの相対パス)
+DEFAULT_ACCOUNTS_DIR = Path("accounts")
+
+
+@dataclass
+class AccountSettings:
+    """Files of one ``[[accounts]]`` entry; each account keeps its own session and token."""
+
+    name: str
+    cookies: Path
+    credentials: Path
+    token: Path
+    chrome_profile: Path
+    gmail_cache: Path | None
+    state: Path
+    checkpoint: Path | None
+
+
+def _add_output_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="書き出し先ファイル (デフォルト: orders.csv / orders.sqlite3 / orders.jsonl)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(OUTPUT_SUFFIXES),
+        default=None,
+        help="出力形式 (デフォルト: --output の拡張子から判定し、判定できなければ csv)",
+    )
+
+
+def _add_gmail_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--credentials",
+        type=Path,
+        default=Path("credentials.json"),
+        help="Gmail APIのクライアントシークレットファイル",
+    )
+    parser.add_argument(
+        "--token",
+        type=Path,
+        default=Path("token.json"),
+        help="Gmail APIのアクセストークン保存ファイル",
+    )
+
+
+def _add_gmail_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--gmail-cache",
+        type=Path,
+        default=Path("gmail_cache.sqlite3"),
+        help="取得済みGmailメッセージのキャッシュファイル (デフォルト: gmail_cache.sqlite3)",
+    )
+    parser.add_argument(
+        "--no-gmail-cache",
+        dest="gmail_cache",
+        action="store_const",
+        const=None,
+        help="Gmailメッセージのキャッシュを使用しない",
+    )
 
 
 def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Amazon注文とGmail通知をCSVにエクスポートします。",
-        epilog="開始日と終了日を指定しなかった場合は、実行時に入力を求めます。",
+        epilog=(
+            "開始日と終了日を指定しなかった場合は、実行時に入力を求めます。"
+            "書き出し後に届いたメールのステータスを反映し続けるには watch を指定します (watch --help を参照)。"
+            "書き出した注文の集計は report で表示できます (report --help を参照)。"
+        ),
     )
     parser.add_argument(
         "start_date",
@@ -41,46 +129,213 @@ def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
         dest="end_date_override",
         help="取得終了日 (YYYY-MM-DD)。引数で指定しない場合は実行時に入力できます。",
     )
-    parser.add_argument(
-        "--output",
-        type=Path,
-        default=Path("orders.csv"),
-        help="書き出し先CSVファイル (デフォルト: orders.csv)",
-    )
+    _add_output_arguments(parser)
     parser.add_argument(
         "--cookies",
         type=Path,
         default=Path("cookies.json"),
         help="Amazonセッション情報を保存するファイル",
     )
+    _add_gmail_arguments(parser)
     parser.add_argument(
-        "--credentials",
+        "--config",
         type=Path,
-        default=Path("credentials.json"),
-        help="Gmail APIのクライアントシークレットファイル",
+        default=DEFAULT_CONFIG_FILE,
+        help="設定値を上書きするTOMLファイル (デフォルト: config.toml)",
     )
     parser.add_argument(
-        "--token",
+        "--chrome-driver",
+        dest="chrome_driver",
         type=Path,
-        default=Path("token.json"),
-        help="Gmail APIのアクセストークン保存ファイル",
+        default=None,
+        help="既存のChromeDriverバイナリへのパス (指定すると自動ダウンロードをスキップ)",
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Chromeを画面なし (ヘッドレス) で起動する",
+    )
+    parser.add_argument(
+        "--chrome-profile",
+        dest="chrome_profile",
+        type=Path,
+        default=None,
+        help="ログイン状態を保持するChromeのプロフィールディレクトリ",
+    )
+    parser.add_argument(
+        "--fast-start",
+        action="store_true",
+        help="ヘッドレス起動と永続プロフィール (既定: chrome-profile) を有効にして起動を高速化する",
+    )
+    parser.add_argument(
+        "--http",
+        action="store_true",
+        help="保存済みクッキーを使いブラウザなしで注文履歴を取得する (ログインが必要な場合はブラウザに切り替え)",
+    )
+    parser.add_argument(
+        "--http-workers",
+        type=int,
+        default=4,
+        help="--http 時に同時に取得するページ数 (デフォルト: 4)",
+    )
+    parser.add_argument(
+        "--drivers",
+        type=int,
+        default=1,
+        help="注文履歴を年・ページ単位に分割し、指定した数のヘッドレスChromeで同時に取得する (上限は config.toml の max_drivers、既定: 4)",
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="期間内のAmazonメールを一括取得し、注文ごとのGmail検索を省略する",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Amazonのページ取得とGmailの照会を並行して実行する",
+    )
+    parser.add_argument(
+        "--gmail-workers",
+        type=int,
+        default=4,
+        help="--pipeline 時にGmailを照会するスレッド数 (デフォルト: 4)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="前回の状態を引き継ぎ、確定済みの注文はGmailを照会せずにCSVへ上書き追記する",
+    )
+    parser.add_argument(
+        "--state",
+        type=Path,
+        default=Path("order_state.sqlite3"),
+        help="--incremental 時に注文の状態を保存するファイル (デフォルト: order_state.sqlite3)",
+    )
+    _add_gmail_cache_arguments(parser)
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        type=Path,
+        const=DEFAULT_PROFILE_REPORT,
+        default=None,
+        help="処理ごとの所要時間と件数をJSONに書き出し、終了時に集計表を表示する (デフォルト: profile.json)",
+    )
+    parser.add_argument(
+        "--cprofile",
+        type=Path,
+        default=None,
+        help="実行全体の cProfile の結果を保存するファイル (pstats 形式)",
     )
     parser.add_argument(
+        "--account",
+        default=None,
+        help="config.toml の [[accounts]] のうち、指定した名前のアカウントだけを実行する",
+    )
+    parser.add_argument(
+        "--account-workers",
+        type=int,
+        default=None,
+        help="複数アカウントを同時に処理するプロセス数 (デフォルト: アカウント数)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        nargs="?",
+        type=Path,
+        const=DEFAULT_CHECKPOINT,
+        default=None,
+        help="取得が終わった月ごとにレコードを保存する (デフォルト: checkpoint.sqlite3)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="--checkpoint に保存済みの月を取得し直さず、続きから実行する",
+    )
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument(
+        "--record",
+        type=Path,
+        default=None,
+        help="取得したAmazonの注文履歴ページとGmail APIの応答を圧縮アーカイブに保存する",
+    )
+    archive_group.add_argument(
+        "--replay",
+        type=Path,
+        default=None,
+        help="--record で保存したアーカイブから、ネットワークに接続せずに注文とレコードを作り直す",
+    )
+
+    return parser.parse_args(argv)
 
+
+def parse_watch_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} watch",
+        description="Gmailの新着メールを定期的に確認し、書き出し済みの出力のステータスだけを更新します。",
+        epilog="先に通常の実行で出力ファイルを作成してください。初回の確認より後に届いたメールが対象です。",
+    )
+    _add_output_arguments(parser)
+    _add_gmail_arguments(parser)
+    parser.add_argument(
         "--config",
         type=Path,
         default=DEFAULT_CONFIG_FILE,
         help="設定値を上書きするTOMLファイル (デフォルト: config.toml)",
     )
     parser.add_argument(
-
-        "--chrome-driver",
-        dest="chrome_driver",
+        "--state",
         type=Path,
+        default=Path("order_state.sqlite3"),
+        help="Gmailの確認位置と注文の状態を保存するファイル (デフォルト: order_state.sqlite3)",
+    )
+    _add_gmail_cache_arguments(parser)
+    parser.add_argument(
+        "--account",
         default=None,
-        help="既存のChromeDriverバイナリへのパス (指定すると自動ダウンロードをスキップ)",
+        help="config.toml の [[accounts]] のうち、監視するアカウントの名前",
     )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=60.0,
+        help="Gmailを確認する間隔 (秒、デフォルト: 60)",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="1回だけ確認して終了する (cron などから定期実行する場合)",
+    )
+    return parser.parse_args(argv)
 
+
+def parse_report_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} report",
+        description="書き出し済みの出力を読み込み、日別・お届け先別・ステータス別の集計と配達中のまま滞留している注文を表示します。",
+    )
+    _add_output_arguments(parser)
+    parser.add_argument(
+        "--stuck-days",
+        type=int,
+        default=7,
+        help="注文日からこの日数を超えても配達中の注文を滞留として数える (デフォルト: 7)",
+    )
+    parser.add_argument(
+        "--as-of",
+        default=None,
+        help="経過日数を数える基準日 (YYYY-MM-DD、デフォルト: 今日)",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="お届け先別の集計と滞留中の注文の一覧に表示する件数 (デフォルト: 20)",
+    )
+    parser.add_argument(
+        "--json",
+        type=Path,
+        default=None,
+        help="すべての集計結果をJSONファイルに書き出す",
+    )
     return parser.parse_args(argv)
 
 
@@ -108,9 +363,6 @@ def _get_path_setting(
             return None
         node = node.get(key)
 
-    return parser.parse_args()
-
-
     if node in (None, ""):
         return None
 
@@ -120,6 +372,120 @@ def _get_path_setting(
     return path
 
 
+def _build_detector(settings: dict[str, Any], config_file: Path) -> StatusDetector:
+    status_settings = settings.get("status", {})
+    keywords = status_settings.get("keywords")
+    subject_statuses = status_settings.get("subject_statuses")
+    if keywords is not None and not (
+        isinstance(keywords, dict)
+        and all(
+            isinstance(values, list) and all(isinstance(value, str) for value in values)
+            for values in keywords.values()
+        )
+    ):
+        raise SystemExit(
+            f"設定ファイルの [status.keywords] は「ステータス = [\"キーワード\", ...]」の形式で指定してください ({config_file})"
+        )
+    if subject_statuses is not None and not (
+        isinstance(subject_statuses, list) and all(isinstance(value, str) for value in subject_statuses)
+    ):
+        raise SystemExit(
+            f"設定ファイルの status.subject_statuses は文字列の配列で指定してください ({config_file})"
+        )
+    return StatusDetector(status_keywords=keywords, subject_statuses=subject_statuses)
+
+
+def _load_accounts(
+    settings: dict[str, Any],
+    config_file: Path,
+    args: argparse.Namespace,
+    *,
+    checkpoint: Path | None,
+) -> list[AccountSettings]:
+    entries = settings.get("accounts", [])
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        raise SystemExit(
+            f"設定ファイルのアカウントは [[accounts]] の配列で指定してください ({config_file})"
+        )
+    accounts: list[AccountSettings] = []
+    for entry in entries:
+        name = entry.get("name")
+        if not isinstance(name, str) or not name.strip():
+            raise SystemExit(f"[[accounts]] には name を指定してください ({config_file})")
+        if any(account.name == name for account in accounts):
+            raise SystemExit(f"[[accounts]] の name が重複しています: {name} ({config_file})")
+        base = config_file.parent / DEFAULT_ACCOUNTS_DIR / name
+
+        def path(key: str, default: Path) -> Path:
+            return _get_path_setting(entry, config_file, key) or default
+
+        accounts.append(
+            AccountSettings(
+                name=name,
+                cookies=path("cookies", base / "cookies.json"),
+                # OAuth クライアントは共有できるため、既定では --credentials を使う
+                credentials=path("credentials", args.credentials),
+                token=path("token", base / "token.json"),
+                chrome_profile=path("chrome_profile", base / "chrome-profile"),
+                gmail_cache=(
+                    path("gmail_cache", base / "gmail_cache.sqlite3")
+                    if args.gmail_cache is not None
+                    else None
+                ),
+                state=path("state", base / "order_state.sqlite3"),
+                checkpoint=(
+                    path("checkpoint", base / DEFAULT_CHECKPOINT.name)
+                    if checkpoint is not None
+                    else None
+                ),
+            )
+        )
+    return accounts
+
+
+def _apply_account(args: argparse.Namespace, account: AccountSettings) -> argparse.Namespace:
+    overrides: dict[str, Any] = {
+        "cookies": account.cookies,
+        "credentials": account.credentials,
+        "token": account.token,
+        "chrome_profile": account.chrome_profile,
+        "gmail_cache": account.gmail_cache,
+        "state": account.state,
+    }
+    # チェックポイントは通常の実行で --checkpoint / --resume を指定したときだけ使う
+    if account.checkpoint is not None:
+        overrides["checkpoint"] = account.checkpoint
+    return argparse.Namespace(**{**vars(args), **overrides})
+
+
+def _select_accounts(args: argparse.Namespace, accounts: list[AccountSettings]) -> list[AccountSettings]:
+    if args.account is None:
+        return accounts
+    selected = [account for account in accounts if account.name == args.account]
+    if not selected:
+        raise SystemExit(f"設定ファイルにアカウント {args.account} が見つかりません ({args.config})")
+    return selected
+
+
+def _resolve_output(args: argparse.Namespace) -> tuple[str, Path]:
+    output_format = args.format
+    if output_format is None:
+        suffix = args.output.suffix.lower() if args.output is not None else ""
+        output_format = OUTPUT_FORMATS.get(suffix, "csv")
+    output = args.output or Path(f"orders{OUTPUT_SUFFIXES[output_format]}")
+    return output_format, output
+
+
+def _build_writer(
+    args: argparse.Namespace, profile: RunProfile, include_account: bool
+) -> CsvWriter | SqliteWriter | JsonlWriter:
+    if args.format == "sqlite":
+        return SqliteWriter(output_file=args.output, profile=profile)
+    if args.format == "jsonl":
+        return JsonlWriter(output_file=args.output, profile=profile)
+    return CsvWriter(output_file=args.output, profile=profile, include_account=include_account)
+
+
 def _resolve_date(initial: str | None, label: str) -> datetime:
     value = initial
     while True:
@@ -137,9 +503,42 @@ def _resolve_date(initial: str | None, label: str) -> datetime:
 
 
 def main(argv: Sequence[str] | None = None) -> None:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv[:1] == ["watch"]:
+        _watch(parse_watch_args(argv[1:]))
+        return
+    if argv[:1] == ["report"]:
+        _report(parse_report_args(argv[1:]))
+        return
     args = parse_args(argv)
+    if args.cprofile is None:
+        _run(args)
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        _run(args)
+    finally:
+        profiler.disable()
+        args.cprofile.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(args.cprofile))
+        print(f"cProfile の結果を {args.cprofile} に保存しました。")
+
+
+def _run(args: argparse.Namespace) -> None:
     start_input = args.start_date_override or args.start_date
     end_input = args.end_date_override or args.end_date
+    if args.replay is not None:
+        if not args.replay.exists():
+            raise SystemExit(f"アーカイブが見つかりません: {args.replay}")
+        archive = RunArchive(args.replay)
+        meta = archive.meta()
+        archive.close()
+        # 期間を省略した場合は記録したときの期間で再生する
+        start_input = start_input or meta.get("start_date")
+        end_input = end_input or meta.get("end_date")
+        # Gmailへの問い合わせ方を記録したときとそろえる
+        args.prefetch = meta.get("prefetch") == "1"
 
     start = _resolve_date(start_input, "開始日")
     end = _resolve_date(end_input, "終了日")
@@ -149,36 +548,335 @@ def main(argv: Sequence[str] | None = None) -> None:
         start = _resolve_date(None, "開始日")
         end = _resolve_date(None, "終了日")
 
+    args.format, args.output = _resolve_output(args)
+    if args.resume and args.checkpoint is None:
+        args.checkpoint = DEFAULT_CHECKPOINT
+    if args.resume and args.record is not None:
+        raise SystemExit("--resume と --record は同時に指定できません。")
+    profile = RunProfile()
+    settings = _load_settings(args.config)
+    accounts = _select_accounts(
+        args, _load_accounts(settings, args.config, args, checkpoint=args.checkpoint)
+    )
+    if args.record is not None or args.replay is not None:
+        if args.incremental:
+            raise SystemExit("--record / --replay と --incremental は同時に指定できません。")
+        if len(accounts) > 1:
+            raise SystemExit("--record / --replay は --account でアカウントを1つ指定して実行してください。")
+
+    if len(accounts) > 1:
+        count = _run_accounts(args, settings, start, end, accounts, profile)
+        print(f"{args.output} に {len(accounts)} アカウント分 {count} 件のレコードを書き出しました。")
+    else:
+        account = accounts[0] if accounts else None
+        run_args = _apply_account(args, account) if account is not None else args
+        records, amazon_fetcher, gmail_client = _iter_account_records(
+            run_args, settings, start, end, profile
+        )
+        if account is not None:
+            records = _tag_account(records, account.name)
+        writer = _build_writer(args, profile, include_account=account is not None)
+        try:
+            count = writer.write(records, upsert=args.incremental)
+        except ArchiveMissing as exc:
+            raise SystemExit(f"{exc}\n出力ファイルは更新していません。") from exc
+        print(f"{args.output} に {count} 件のレコードを書き出しました。")
+        if amazon_fetcher.page_load_times:
+            load_times = amazon_fetcher.page_load_times
+            print(
+                f"Amazonページ読み込み: {len(load_times)} 回 / 平均 {sum(load_times) / len(load_times):.2f} 秒"
+                f" / 最大 {max(load_times):.2f} 秒"
+            )
+        if gmail_client.cache is not None:
+            stats = gmail_client.cache.stats()
+            print(
+                f"Gmailキャッシュ: ヒット {stats['hits']} 件 / ミス {stats['misses']} 件"
+                f" (保存件数 {stats['entries']} 件)"
+            )
+        if gmail_client.archive is not None:
+            stats = gmail_client.archive.stats()
+            gmail_client.archive.close()
+            print(
+                f"{args.record} に注文履歴 {stats['pages']} ページとGmailの応答 {stats['responses']} 件を記録しました"
+                f" ({stats['stored_bytes'] / 1e6:.1f} MB、圧縮前 {stats['raw_bytes'] / 1e6:.1f} MB)。"
+            )
+    if args.profile is not None:
+        profile.finish()
+        profile.write_json(args.profile)
+        print()
+        print(profile.summary())
+        print(f"計測結果を {args.profile} に保存しました。")
+
+
+def _watch_account(
+    settings: dict[str, Any], args: argparse.Namespace
+) -> tuple[AccountSettings | None, argparse.Namespace]:
+    """Pick the single account ``watch`` runs for and return it with its arguments applied."""
+    # watch はチェックポイントを使わない
+    accounts = _select_accounts(args, _load_accounts(settings, args.config, args, checkpoint=None))
+    if len(accounts) > 1:
+        raise SystemExit("watch は1アカウントずつ実行してください。--account で監視するアカウントを指定してください。")
+    account = accounts[0] if accounts else None
+    return account, _apply_account(args, account) if account is not None else args
+
+
+def _watch(args: argparse.Namespace) -> None:
+    args.format, args.output = _resolve_output(args)
+    if not args.output.exists():
+        raise SystemExit(f"{args.output} が見つかりません。先に通常の実行で出力ファイルを作成してください。")
+    if args.interval <= 0:
+        raise SystemExit("--interval には0より大きい秒数を指定してください。")
     settings = _load_settings(args.config)
+    account, run_args = _watch_account(settings, args)
+
+    profile = RunProfile()
+    gmail_client = GmailClient(
+        config=GmailConfig(
+            credentials_file=run_args.credentials,
+            token_file=run_args.token,
+            cache_file=run_args.gmail_cache,
+        ),
+        profile=profile,
+    )
+    detector = _build_detector(settings, args.config)
+    state_store = OrderStateStore(run_args.state)
+    watcher = MailboxWatcher(
+        gmail_client=gmail_client,
+        detector=detector,
+        processor=OrderProcessor(detector=detector, gmail_client=gmail_client, profile=profile),
+        writer=_build_writer(args, profile, include_account=account is not None),
+        state_store=state_store,
+        account=account.name if account is not None else "",
+        profile=profile,
+        # 初回は出力を書き出した時刻以降のメールを検索して反映する
+        since=args.output.stat().st_mtime,
+    )
+    if not args.once:
+        print(f"{args.output} を {args.interval:g} 秒ごとに更新します (Ctrl+C で終了)。")
+    try:
+        watcher.run(args.interval, once=args.once)
+    except KeyboardInterrupt:
+        print("監視を終了しました。")
+    finally:
+        state_store.close()
+
+
+def _report(args: argparse.Namespace) -> None:
+    # NumPy は集計でしか使わないため、ここで読み込む
+    from .report import aggregate, format_report, load_columns, write_json
+
+    args.format, args.output = _resolve_output(args)
+    if not args.output.exists():
+        raise SystemExit(f"{args.output} が見つかりません。先に通常の実行で出力ファイルを作成してください。")
+    if args.stuck_days < 1:
+        raise SystemExit("--stuck-days には1以上の日数を指定してください。")
+    as_of = None
+    if args.as_of is not None:
+        try:
+            as_of = datetime.strptime(args.as_of, DATE_FORMAT).date()
+        except ValueError:
+            raise SystemExit("--as-of の形式が正しくありません。例: 2023-09-01") from None
+
+    try:
+        columns = load_columns(args.output, args.format)
+    except RuntimeError as exc:
+        raise SystemExit(str(exc)) from exc
+    report = aggregate(columns, stuck_days=args.stuck_days, as_of=as_of)
+    print(format_report(report, top=args.top))
+    if args.json is not None:
+        write_json(report, args.json)
+        print(f"集計結果を {args.json} に保存しました。")
+
+
+def _iter_account_records(
+    args: argparse.Namespace,
+    settings: dict[str, Any],
+    start: datetime,
+    end: datetime,
+    profile: RunProfile,
+    label: str = "",
+) -> tuple[
+    Iterator[OrderRecord],
+    AmazonOrderFetcher | HttpOrderFetcher | DriverPoolFetcher | ArchiveOrderFetcher,
+    GmailClient,
+]:
     driver_path = args.chrome_driver or _get_path_setting(
         settings, args.config, "amazon", "chrome_driver"
     )
 
+    amazon_settings = settings.get("amazon", {})
+    headless = args.headless or bool(amazon_settings.get("headless", False)) or args.fast_start
+    chrome_profile = args.chrome_profile or _get_path_setting(
+        settings, args.config, "amazon", "chrome_profile"
+    )
+    if chrome_profile is None and args.fast_start:
+        chrome_profile = DEFAULT_CHROME_PROFILE
+
+    max_drivers = amazon_settings.get("max_drivers", AmazonConfig.max_drivers)
+    if not isinstance(max_drivers, int) or isinstance(max_drivers, bool) or max_drivers < 1:
+        raise SystemExit(f"設定ファイルの amazon.max_drivers は1以上の整数で指定してください ({args.config})")
+    if args.http and args.drivers > 1:
+        raise SystemExit("--http と --drivers は同時に指定できません。")
+
     amazon_config = AmazonConfig(
         cookie_file=args.cookies,
-
         driver_path=driver_path,
+        headless=headless,
+        user_data_dir=chrome_profile,
+        max_drivers=max_drivers,
     )
+    record = RunArchive(args.record, mode="w") if args.record is not None else None
+    replay = RunArchive(args.replay) if args.replay is not None else None
     gmail_config = GmailConfig(
         credentials_file=args.credentials,
         token_file=args.token,
+        # キャッシュから答えた応答は記録できず、再生時はアーカイブだけを使うため、どちらも無効にする
+        cache_file=args.gmail_cache if record is None and replay is None else None,
     )
 
-        driver_path=args.chrome_driver,
+    amazon_fetcher = AmazonOrderFetcher(config=amazon_config, profile=profile, archive=record)
+    if replay is not None:
+        amazon_fetcher = ArchiveOrderFetcher(replay, config=amazon_config, profile=profile)
+    elif args.drivers > 1:
+        amazon_fetcher = DriverPoolFetcher(
+            config=amazon_config,
+            size=args.drivers,
+            fallback=amazon_fetcher,
+            profile=profile,
+            archive=record,
+        )
+    elif args.http:
+        amazon_fetcher = HttpOrderFetcher(
+            config=amazon_config,
+            max_workers=args.http_workers,
+            fallback=amazon_fetcher,
+            profile=profile,
+            archive=record,
+        )
+    gmail_client = GmailClient(
+        config=gmail_config,
+        service=ReplayGmailService(replay) if replay is not None else None,
+        profile=profile,
+        archive=record,
+    )
+    detector = _build_detector(settings, args.config)
+    today = None
+    if record is not None:
+        record.put_meta(
+            start_date=start.strftime(DATE_FORMAT),
+            end_date=end.strftime(DATE_FORMAT),
+            recorded_on=date.today().isoformat(),
+            prefetch="1" if args.prefetch else "0",
+        )
+        # 再生時にキーワードを変えても判定し直せるよう、件名で判定できるメールも本文まで取得して記録する
+        detector.subject_statuses = frozenset()
+    elif replay is not None:
+        # 「明日」などの到着日は記録した日を基準に解釈する
+        today = date.fromisoformat(replay.meta()["recorded_on"])
+    state_store = OrderStateStore(args.state) if args.incremental else None
+    processor = OrderProcessor(
+        detector=detector,
+        gmail_client=gmail_client,
+        state_store=state_store,
+        today=today,
+        profile=profile,
     )
-    gmail_config = GmailConfig(credentials_file=args.credentials, token_file=args.token)
-
-
-    amazon_fetcher = AmazonOrderFetcher(config=amazon_config)
-    gmail_client = GmailClient(config=gmail_config)
-    detector = StatusDetector()
-    processor = OrderProcessor(detector=detector, gmail_client=gmail_client)
-    writer = CsvWriter(output_file=args.output)
 
-    orders = amazon_fetcher.fetch_orders(start, end)
-    records = processor.process_orders(orders)
-    writer.write(records)
-    print(f"{args.output} に {len(records)} 件のレコードを書き出しました。")
+    checkpoint = None
+    fetch_end: datetime | None = end
+    if args.checkpoint is not None:
+        try:
+            checkpoint = ShardCheckpoint(args.checkpoint, start, end, resume=args.resume, label=label)
+        except RuntimeError as exc:
+            raise SystemExit(str(exc)) from exc
+        # 保存済みの月より古い期間だけを取得する
+        fetch_end = checkpoint.pending_end()
+
+    records: Iterator[OrderRecord] = iter(())
+    if fetch_end is not None:
+        prefetch_window = (start, fetch_end) if args.prefetch else None
+        if args.pipeline:
+            records = iter_pipelined(
+                amazon_fetcher,
+                processor,
+                start,
+                fetch_end,
+                workers=args.gmail_workers,
+                prefetch_window=prefetch_window,
+            )
+        else:
+            records = processor.iter_records(
+                amazon_fetcher.iter_orders(start, fetch_end), prefetch_window=prefetch_window
+            )
+    if checkpoint is not None:
+        records = checkpoint.track(records)
+    return records, amazon_fetcher, gmail_client
+
+
+def _tag_account(records: Iterator[OrderRecord], name: str) -> Iterator[OrderRecord]:
+    for record in records:
+        # 商品ごとの行は注文単位の値を共有しているため、1回の代入で注文全体に反映される
+        record.details.account = name
+        yield record
+
+
+def _run_account(
+    args: argparse.Namespace,
+    settings: dict[str, Any],
+    start: datetime,
+    end: datetime,
+    account: AccountSettings,
+) -> tuple[list[OrderRecord], dict[str, Any]]:
+    """Worker process entry point: collect one account's records and its profile report."""
+    profile = RunProfile()
+    # ワーカープロセスでは手動ログインができないため、画面なしで起動する
+    run_args = _apply_account(args, account)
+    run_args.headless = True
+    records, _, _ = _iter_account_records(
+        run_args, settings, start, end, profile, label=f"{account.name}: "
+    )
+    rows = list(_tag_account(records, account.name))
+    profile.finish()
+    return rows, profile.report()
+
+
+def _run_accounts(
+    args: argparse.Namespace,
+    settings: dict[str, Any],
+    start: datetime,
+    end: datetime,
+    accounts: list[AccountSettings],
+    profile: RunProfile,
+) -> int:
+    """Run every account in its own process and write the merged records in config order."""
+    workers = max(1, min(args.account_workers or len(accounts), len(accounts)))
+    print(f"{len(accounts)} アカウントを {workers} プロセスで処理します。")
+    results: dict[str, list[OrderRecord]] = {}
+    failures: list[str] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            account.name: executor.submit(_run_account, args, settings, start, end, account)
+            for account in accounts
+        }
+        for name, future in futures.items():
+            try:
+                records, report = future.result()
+            except Exception as exc:
+                failures.append(f"{name}: {exc}")
+                continue
+            results[name] = records
+            profile.merge(report)
+            print(f"{name}: {len(records)} 件のレコードを取得しました。")
+    if failures:
+        raise SystemExit(
+            "次のアカウントの処理に失敗したため、出力ファイルは更新していません。\n"
+            + "\n".join(failures)
+            + "\nログインが必要な場合は --account <名前> を付けて画面ありで一度実行してください。"
+        )
+    writer = _build_writer(args, profile, include_account=True)
+    return writer.write(
+        chain.from_iterable(results[account.name] for account in accounts), upsert=args.incremental
+    )
 
 
 if __name__ == "__main__":
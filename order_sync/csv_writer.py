@@ -1,47 +1,180 @@
 from __future__ import annotations
 
 import csv
+import os
+import time
 from pathlib import Path
 from typing import Iterable
 
-from .models import OrderRecord
+from .models import OrderRecord, StatusUpdate, arrival_overrides_status
+from .profiling import RunProfile
+
+FIELDNAMES = [
+    "年月日",
+    "金額",
+    "お届け先（名前）",
+    "お届け先（住所）",
+    "商品名",
+    "個数",
+    "注文番号",
+    "到着日",
+    "ステータス",
+    "宅配ボックス情報",
+    "テンプレート文",
+]
+# 複数アカウントの結果をまとめる場合に先頭へ追加する列
+ACCOUNT_FIELD = "アカウント"
 
 
 class CsvWriter:
-    def __init__(self, output_file: Path = Path("orders.csv")):
+    def __init__(
+        self,
+        output_file: Path = Path("orders.csv"),
+        flush_seconds: float = 1.0,
+        profile: RunProfile | None = None,
+        include_account: bool = False,
+    ):
         self.output_file = output_file
+        self.flush_seconds = flush_seconds
+        self.profile = profile or RunProfile()
+        self.include_account = include_account
+
+    @property
+    def fieldnames(self) -> list[str]:
+        return [ACCOUNT_FIELD, *FIELDNAMES] if self.include_account else FIELDNAMES
+
+    @property
+    def partial_file(self) -> Path:
+        return self.output_file.with_name(f"{self.output_file.name}.part")
+
+    def _to_row(self, record: OrderRecord) -> dict[str, str]:
+        row = {
+            "年月日": record.order_date,
+            "金額": record.price,
+            "お届け先（名前）": record.delivery_name,
+            "お届け先（住所）": record.delivery_address,
+            "商品名": record.title,
+            "個数": record.quantity,
+            "注文番号": record.order_number,
+            "到着日": record.arrival,
+            "ステータス": record.status,
+            "宅配ボックス情報": record.locker_message,
+            "テンプレート文": record.template_message or "",
+        }
+        if self.include_account:
+            row[ACCOUNT_FIELD] = record.account
+        return row
+
+    def _read_rows(self) -> list[dict[str, str]]:
+        if not self.output_file.exists():
+            return []
+        with self.output_file.open("r", newline="", encoding="utf-8-sig") as handle:
+            return list(csv.DictReader(handle))
+
+    def write(self, records: Iterable[OrderRecord], upsert: bool = False) -> int:
+        """Stream ``records`` to the CSV file and return the number of rows written.
 
-    def write(self, records: Iterable[OrderRecord]) -> None:
-        fieldnames = [
-            "年月日",
-            "金額",
-            "お届け先（名前）",
-            "お届け先（住所）",
-            "商品名",
-            "個数",
-            "注文番号",
-            "到着日",
-            "ステータス",
-            "宅配ボックス情報",
-            "テンプレート文",
-        ]
+        Rows go to ``<output>.part`` as they arrive and are flushed regularly, so
+        partial results can be inspected during long runs. The file replaces
+        the output only after every record was written. With ``upsert``, rows
+        already in the output are kept and only the rows of orders present in
+        ``records`` are replaced (new orders are appended).
+        """
         self.output_file.parent.mkdir(parents=True, exist_ok=True)
-        with self.output_file.open("w", newline="", encoding="utf-8-sig") as handle:
-            writer = csv.DictWriter(handle, fieldnames=fieldnames)
+        partial = self.partial_file
+        count = 0
+        # 書き出し時間だけを計測する (records の生成時間は上流の処理に含まれる)
+        elapsed = 0.0
+        with partial.open("w", newline="", encoding="utf-8-sig") as handle:
+            writer = csv.DictWriter(handle, fieldnames=self.fieldnames)
             writer.writeheader()
+            last_flush = time.monotonic()
             for record in records:
-                writer.writerow(
-                    {
-                        "年月日": record.order_date,
-                        "金額": record.price,
-                        "お届け先（名前）": record.delivery_name,
-                        "お届け先（住所）": record.delivery_address,
-                        "商品名": record.title,
-                        "個数": record.quantity,
-                        "注文番号": record.order_number,
-                        "到着日": record.arrival,
-                        "ステータス": record.status,
-                        "宅配ボックス情報": record.locker_message,
-                        "テンプレート文": record.template_message or "",
-                    }
-                )
+                started = time.perf_counter()
+                writer.writerow(self._to_row(record))
+                count += 1
+                if time.monotonic() - last_flush >= self.flush_seconds:
+                    handle.flush()
+                    last_flush = time.monotonic()
+                elapsed += time.perf_counter() - started
+            started = time.perf_counter()
+            if upsert and self.output_file.exists():
+                handle.flush()
+                with partial.open("r", newline="", encoding="utf-8-sig") as written:
+                    updates = list(csv.DictReader(written))
+                handle.seek(0)
+                handle.truncate()
+                writer.writeheader()
+                writer.writerows(self._merge_rows(self._read_rows(), updates, self.fieldnames))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(partial, self.output_file)
+        self.profile.add_time("csv_write", elapsed + time.perf_counter() - started)
+        self.profile.count("csv_rows", count)
+        return count
+
+    def update_statuses(self, updates: Iterable[StatusUpdate]) -> int:
+        """Rewrite the status columns of the orders in ``updates`` and return the number of rows changed.
+
+        Other rows are copied unchanged, and rows whose arrival already reads
+        到着済 keep that status as in a full run. The file is only replaced
+        when a row changed.
+        """
+        started = time.perf_counter()
+        by_order = {(update.account, update.order_number): update for update in updates}
+        rows = self._read_rows()
+        changed = 0
+        for row in rows:
+            update = by_order.get((row.get(ACCOUNT_FIELD, ""), row.get("注文番号", "")))
+            if update is None or arrival_overrides_status(row.get("到着日", "")):
+                continue
+            values = {
+                "ステータス": update.status,
+                "宅配ボックス情報": update.locker_message,
+                "テンプレート文": update.template_message or "",
+            }
+            if all(row.get(name) == value for name, value in values.items()):
+                continue
+            row.update(values)
+            changed += 1
+        if changed:
+            partial = self.partial_file
+            with partial.open("w", newline="", encoding="utf-8-sig") as handle:
+                writer = csv.DictWriter(handle, fieldnames=self.fieldnames)
+                writer.writeheader()
+                writer.writerows({name: row.get(name, "") for name in self.fieldnames} for row in rows)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(partial, self.output_file)
+        self.profile.add_time("csv_write", time.perf_counter() - started)
+        self.profile.count("status_updates", changed)
+        return changed
+
+    @staticmethod
+    def _merge_rows(
+        existing: list[dict[str, str]],
+        updates: list[dict[str, str]],
+        fieldnames: list[str] = FIELDNAMES,
+    ) -> list[dict[str, str]]:
+        # 複数アカウントの出力では、注文番号をアカウントごとに区別する
+        def key(row: dict[str, str]) -> tuple[str, str]:
+            return row.get(ACCOUNT_FIELD, ""), row.get("注文番号", "")
+
+        updated_orders: dict[tuple[str, str], list[dict[str, str]]] = {}
+        for row in updates:
+            updated_orders.setdefault(key(row), []).append(row)
+
+        merged: list[dict[str, str]] = []
+        emitted: set[tuple[str, str]] = set()
+        for row in existing:
+            order_key = key(row)
+            if order_key in updated_orders:
+                if order_key not in emitted:
+                    merged.extend(updated_orders[order_key])
+                    emitted.add(order_key)
+                continue
+            merged.append({name: row.get(name, "") for name in fieldnames})
+        for order_key, order_rows in updated_orders.items():
+            if order_key not in emitted:
+                merged.extend(order_rows)
+        return merged
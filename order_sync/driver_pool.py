@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterator
+
+from .amazon import AmazonConfig, AmazonOrderFetcher, HistoryPage, PageSizeMismatch, check_page_size
+from .http_fetcher import SigninRequired
+from .models import Order
+from .profiling import RunProfile
+
+if TYPE_CHECKING:
+    from .archive import RunArchive
+
+
+@dataclass
+class _YearProgress:
+    next_index: int = 0
+    # このページ番号で年の終わりに達した (これより後のページは使わない)
+    last_index: int | None = None
+    in_flight: int = 0
+    # 解析済みで、まだ取り出されていないページの数
+    buffered: int = 0
+
+
+class _PageScheduler:
+    """Hand out (year, page index) tasks to the drivers and collect the parsed pages.
+
+    Idle drivers go to the year with the fewest pages in flight, so with at
+    least as many years as drivers each driver walks its own year, and with
+    fewer years the drivers stride over the pages of the same year. At most
+    ``max_ahead`` pages per year are in flight or waiting to be consumed;
+    drivers wait for the consumer beyond that.
+    """
+
+    def __init__(self, years: list[int], start_date: datetime, max_ahead: int):
+        self.years = years
+        self.start_date = start_date
+        self.max_ahead = max_ahead
+        self.progress = {year: _YearProgress() for year in years}
+        self.pages: dict[tuple[int, int], HistoryPage] = {}
+        self.error: BaseException | None = None
+        self.stopped = False
+        self.ready = threading.Condition()
+
+    def _is_open(self, year: int) -> bool:
+        progress = self.progress[year]
+        return progress.last_index is None or progress.next_index <= progress.last_index
+
+    def _has_room(self, year: int) -> bool:
+        progress = self.progress[year]
+        return progress.in_flight + progress.buffered < self.max_ahead
+
+    def next_task(self) -> tuple[int, int] | None:
+        """Return the next page to fetch, waiting while every open year is ``max_ahead`` pages ahead."""
+        with self.ready:
+            while True:
+                if self.stopped or self.error is not None:
+                    return None
+                open_years = [year for year in self.years if self._is_open(year)]
+                if not open_years:
+                    return None
+                # 取り出されるページは年ごとに先頭から順に消費されるため、待っても行き詰まらない
+                candidates = [year for year in open_years if self._has_room(year)]
+                if candidates:
+                    break
+                self.ready.wait()
+            year = min(candidates, key=lambda candidate: self.progress[candidate].in_flight)
+            progress = self.progress[year]
+            index = progress.next_index
+            progress.next_index += 1
+            progress.in_flight += 1
+            return year, index
+
+    def complete(self, year: int, index: int, page: HistoryPage) -> None:
+        with self.ready:
+            progress = self.progress[year]
+            progress.in_flight -= 1
+            progress.buffered += 1
+            self.pages[(year, index)] = page
+            # 通常の取得と同じく、次のページへのリンクがなくなるか期間の開始より前に達したら年を終える
+            if not page.next_href or (page.order_dates and min(page.order_dates) < self.start_date):
+                if progress.last_index is None or index < progress.last_index:
+                    progress.last_index = index
+            self.ready.notify_all()
+
+    def fail(self, exc: BaseException) -> None:
+        with self.ready:
+            if self.error is None:
+                self.error = exc
+            self.ready.notify_all()
+
+    def stop(self) -> None:
+        with self.ready:
+            self.stopped = True
+            self.ready.notify_all()
+
+    def wait_for(self, year: int, index: int) -> HistoryPage | None:
+        """Block until page ``index`` of ``year`` is parsed; None once the year has ended before it."""
+        progress = self.progress[year]
+        with self.ready:
+            self.ready.wait_for(
+                lambda: self.error is not None
+                or (year, index) in self.pages
+                or (progress.last_index is not None and index > progress.last_index)
+            )
+            if self.error is not None:
+                raise self.error
+            if progress.last_index is not None and index > progress.last_index:
+                return None
+            progress.buffered -= 1
+            # 先読みの上限で待っているドライバーを起こす
+            self.ready.notify_all()
+            return self.pages.pop((year, index))
+
+
+class DriverPoolFetcher:
+    """Scrape order history with several headless Chrome instances at once.
+
+    The window is split into (year, page) partitions that are opened directly
+    through the year filter and ``startIndex``. Every instance replays the
+    cookies saved by the regular fetcher, so they share its session. Pages are
+    yielded in the same order as ``AmazonOrderFetcher.iter_pages`` and orders
+    are deduplicated by order number. Drivers fetch at most ``max_ahead``
+    pages per year ahead of the consumer. If Amazon asks for a sign-in before
+    any page was produced, the interactive ``fallback`` takes over; if a page
+    does not hold ``orders_per_page`` orders, the ``fallback`` pages through
+    the history one page at a time and skips the orders already yielded.
+    """
+
+    def __init__(
+        self,
+        config: AmazonConfig | None = None,
+        size: int = 4,
+        fallback: AmazonOrderFetcher | None = None,
+        profile: RunProfile | None = None,
+        archive: RunArchive | None = None,
+        max_ahead: int | None = None,
+    ):
+        self.config = config or AmazonConfig()
+        self.size = max(1, min(size, self.config.max_drivers))
+        self.max_ahead = max(1, max_ahead or self.size * 2)
+        self.fallback = fallback
+        self.profile = profile or RunProfile()
+        self.archive = archive
+        self.parser = fallback or AmazonOrderFetcher(self.config, profile=self.profile)
+        self.page_load_times: list[float] = []
+
+    def _worker_config(self) -> AmazonConfig:
+        # ドライバーの解決は一度だけ行い、プロフィールはロックされるため共有しない
+        driver_path, _ = self.parser._resolve_driver_binary()
+        return replace(self.config, headless=True, user_data_dir=None, driver_path=driver_path)
+
+    def _work(
+        self, config: AmazonConfig, scheduler: _PageScheduler, start_date: datetime, end_date: datetime
+    ) -> None:
+        fetcher = AmazonOrderFetcher(config, profile=self.profile, archive=self.archive)
+        fetcher.page_load_times = self.page_load_times
+        try:
+            with self.profile.stage("chrome_start"):
+                driver = fetcher._create_driver()
+        except BaseException as exc:
+            scheduler.fail(exc)
+            return
+        try:
+            if not config.cookie_file.exists():
+                raise SigninRequired(f"クッキーファイルが見つかりません: {config.cookie_file}")
+            fetcher._load_cookies(driver)
+            while True:
+                task = scheduler.next_task()
+                if task is None:
+                    break
+                year, index = task
+                fetcher._navigate(driver, fetcher._year_url(year, index * config.orders_per_page))
+                if "signin" in driver.current_url:
+                    raise SigninRequired("Amazonのセッションが切れています。")
+                html = driver.page_source
+                self.profile.count("amazon_bytes", len(html.encode("utf-8")))
+                if self.archive is not None:
+                    self.archive.put_page(year, index, html)
+                scheduler.complete(year, index, fetcher.parse_page(html, start_date, end_date))
+        except BaseException as exc:
+            scheduler.fail(exc)
+        finally:
+            driver.quit()
+
+    def _iter_pool_pages(
+        self, start_date: datetime, end_date: datetime, seen: set[str]
+    ) -> Iterator[list[Order]]:
+        years = list(range(end_date.year, start_date.year - 1, -1))
+        scheduler = _PageScheduler(years, start_date, self.max_ahead)
+        config = self._worker_config()
+        workers = [
+            threading.Thread(
+                target=self._work,
+                args=(config, scheduler, start_date, end_date),
+                name=f"amazon-driver-{index}",
+                daemon=True,
+            )
+            for index in range(self.size)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for year in years:
+                index = 0
+                while True:
+                    page = scheduler.wait_for(year, index)
+                    if page is None:
+                        break
+                    check_page_size(page, self.config.orders_per_page)
+                    orders = [
+                        order
+                        for order in page.orders
+                        if not order.order_number or order.order_number not in seen
+                    ]
+                    seen.update(order.order_number for order in orders)
+                    yield orders
+                    if page.order_dates and min(page.order_dates) < start_date:
+                        return
+                    index += 1
+        finally:
+            scheduler.stop()
+            for worker in workers:
+                worker.join()
+
+    def iter_pages(self, start_date: datetime, end_date: datetime) -> Iterator[list[Order]]:
+        produced = False
+        seen: set[str] = set()
+        try:
+            for orders in self._iter_pool_pages(start_date, end_date, seen):
+                produced = True
+                yield orders
+        except SigninRequired:
+            if produced or self.fallback is None:
+                raise
+            print("並行取得にはログインが必要なため、通常のブラウザでの取得に切り替えます。")
+            yield from self.fallback.iter_pages(start_date, end_date)
+        except PageSizeMismatch as exc:
+            if self.fallback is None:
+                raise
+            print(f"{exc} ページを順にたどる通常のブラウザでの取得に切り替えます。")
+            for orders in self.fallback.iter_pages(start_date, end_date):
+                yield [order for order in orders if not order.order_number or order.order_number not in seen]
+
+    def iter_orders(self, start_date: datetime, end_date: datetime) -> Iterator[Order]:
+        for page in self.iter_pages(start_date, end_date):
+            yield from page
+
+    def fetch_orders(self, start_date: datetime, end_date: datetime) -> list[Order]:
+        return list(self.iter_orders(start_date, end_date))
@@ -1,14 +1,62 @@
 from __future__ import annotations
 
 import base64
+import json
+import os
+import re
+import threading
+import time
 from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import Iterable, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Optional, Sequence, Tuple
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from .message_cache import MessageCache
+from .profiling import RunProfile
+
+# google-auth / googleapiclient は読み込みに時間がかかるため、Gmail に接続する時点で import する
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+    from .archive import RunArchive
+
+# Gmail API のバッチリクエストに含められるサブリクエストの上限
+BATCH_LIMIT = 100
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+# 403 はレート制限によるものだけを再試行する (権限不足などは何度送っても失敗する)
+RATE_LIMIT_REASONS = frozenset({"rateLimitExceeded", "userRateLimitExceeded"})
+ORDER_NUMBER_PATTERN = re.compile(r"\d{3}-\d{7}-\d{7}")
+# sender_query の from: に指定された送信元 (履歴から取得したメールの絞り込みに使う)
+SENDER_PATTERN = re.compile(r"from:\s*(\S+)", re.IGNORECASE)
+# 件名だけを取得する際と、本文の text/plain を取得する際のレスポンス射影
+METADATA_FIELDS = "id,payload/headers"
+BODY_FIELDS = "id,payload(mimeType,body/data,parts(mimeType,body/data))"
+# 手元に Discovery ドキュメントがない場合の取得元
+DISCOVERY_URL = "https://gmail.googleapis.com/$discovery/rest?version=v1"
+
+
+class HistoryExpired(RuntimeError):
+    """Gmail no longer keeps the mailbox history from the requested ``historyId``."""
+
+
+def _error_reasons(exception: BaseException) -> set[str]:
+    """Return the ``reason`` values of a Gmail API error response body."""
+    content = getattr(exception, "content", None)
+    try:
+        error = json.loads(content)["error"]
+    except (TypeError, ValueError, KeyError):
+        return set()
+    if not isinstance(error, dict):
+        return set()
+    entries = [*error.get("errors", []), *error.get("details", [])]
+    return {entry["reason"] for entry in entries if isinstance(entry, dict) and "reason" in entry}
+
+
+def _is_retryable(exception: BaseException) -> bool:
+    status = getattr(getattr(exception, "resp", None), "status", None)
+    if status == 403:
+        return bool(_error_reasons(exception) & RATE_LIMIT_REASONS)
+    return status in RETRYABLE_STATUSES
 
 
 @dataclass
@@ -16,14 +64,51 @@ class GmailConfig:
     credentials_file: Path = Path("credentials.json")
     token_file: Path = Path("token.json")
     scopes: tuple[str, ...] = ("https://www.googleapis.com/auth/gmail.readonly",)
+    batch_size: int = 50
+    batch_retries: int = 3
+    retry_wait_seconds: float = 1.0
+    sender_query: str = "from:amazon.co.jp"
+    cache_file: Path | None = Path("gmail_cache.sqlite3")
+    cache_max_entries: int = 50000
+    cache_max_age_days: float = 365.0
+    # Gmail API の Discovery ドキュメントの保存先。サービスの構築時にネットワークへ問い合わせない
+    discovery_file: Path | None = Path("gmail_discovery.json")
 
 
 class GmailClient:
-    def __init__(self, config: GmailConfig | None = None):
+    def __init__(
+        self,
+        config: GmailConfig | None = None,
+        service: Any = None,
+        profile: RunProfile | None = None,
+        archive: RunArchive | None = None,
+    ):
         self.config = config or GmailConfig()
-        self._service = None
+        self.profile = profile or RunProfile()
+        self._service = service
+        # 指定するとAPIの応答をすべて記録する (--record)
+        self.archive = archive
+        self._credentials: Credentials | None = None
+        self._credentials_lock = threading.Lock()
+        self._discovery: dict | None = None
+        self._local = threading.local()
+        self._order_index: dict[str, list[str]] | None = None
+        self._prefetched: dict[str, Tuple[str, Optional[str]]] = {}
+        self.cache = (
+            MessageCache(
+                self.config.cache_file,
+                max_entries=self.config.cache_max_entries,
+                max_age_days=self.config.cache_max_age_days,
+            )
+            if self.config.cache_file is not None
+            else None
+        )
 
     def _load_credentials(self) -> Credentials:
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
         creds: Optional[Credentials] = None
         if self.config.token_file.exists():
             creds = Credentials.from_authorized_user_file(str(self.config.token_file), list(self.config.scopes))
@@ -42,32 +127,240 @@ class GmailClient:
 
     @property
     def service(self):
-        if self._service is None:
-            creds = self._load_credentials()
-            self._service = build("gmail", "v1", credentials=creds, cache_discovery=False)
-        return self._service
+        if self._service is not None:
+            return self._service
+        # httplib2 はスレッドセーフではないため、スレッドごとにサービスを構築する
+        service = getattr(self._local, "service", None)
+        if service is None:
+            from googleapiclient.discovery import build_from_document
+
+            with self._credentials_lock:
+                if self._credentials is None:
+                    self._credentials = self._load_credentials()
+                if self._discovery is None:
+                    self._discovery = self._load_discovery_document()
+            service = build_from_document(self._discovery, credentials=self._credentials)
+            if self.archive is not None:
+                from .archive import RecordingGmailService
+
+                service = RecordingGmailService(service, self.archive)
+            self._local.service = service
+        return service
+
+    def _load_discovery_document(self) -> dict:
+        """Return the Gmail discovery document from ``discovery_file``, saving it there first if needed.
+
+        The document bundled with googleapiclient is used when available;
+        otherwise it is downloaded once.
+        """
+        path = self.config.discovery_file
+        if path is not None and path.exists():
+            try:
+                return json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                pass
+        try:
+            from googleapiclient.discovery_cache import get_static_doc
+
+            content = get_static_doc("gmail", "v1")
+        except ImportError:
+            content = None
+        if content is None:
+            import requests
+
+            response = requests.get(DISCOVERY_URL, timeout=30)
+            response.raise_for_status()
+            content = response.text
+        if path is not None:
+            # 複数アカウントのプロセスが同時に書いても壊れたファイルを読まないよう置き換えで保存する
+            path.parent.mkdir(parents=True, exist_ok=True)
+            partial = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            partial.write_text(content, encoding="utf-8")
+            os.replace(partial, path)
+        return json.loads(content)
 
     def search_messages(self, query: str, max_results: int = 10) -> Iterable[dict]:
-        response = (
-            self.service.users()
-            .messages()
-            .list(userId="me", q=query, maxResults=max_results)
-            .execute()
-        )
+        with self.profile.stage("gmail_search"):
+            response = (
+                self.service.users()
+                .messages()
+                .list(userId="me", q=query, maxResults=max_results)
+                .execute()
+            )
+        self.profile.count("gmail_api_calls")
         for message in response.get("messages", []):
             yield message
 
+    def list_messages(self, query: str, page_size: int = 500) -> Iterator[dict]:
+        """Yield every message matching ``query``, following ``nextPageToken`` to the end."""
+        page_token = None
+        while True:
+            with self.profile.stage("gmail_search"):
+                response = (
+                    self.service.users()
+                    .messages()
+                    .list(userId="me", q=query, maxResults=page_size, pageToken=page_token)
+                    .execute()
+                )
+            self.profile.count("gmail_api_calls")
+            yield from response.get("messages", [])
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+    def search_since(self, since: float) -> list[str]:
+        """Return the ids of Amazon mails received after the Unix time ``since``, oldest first."""
+        query = f"{self.config.sender_query} after:{int(since)}"
+        return [meta["id"] for meta in self.list_messages(query)][::-1]
+
+    def current_history_id(self) -> str:
+        """Return the latest ``historyId`` of the mailbox."""
+        with self.profile.stage("gmail_history"):
+            response = self.service.users().getProfile(userId="me").execute()
+        self.profile.count("gmail_api_calls")
+        return str(response["historyId"])
+
+    def list_history(self, start_history_id: str, page_size: int = 500) -> tuple[list[str], str]:
+        """Return the ids of messages added after ``start_history_id`` (oldest first) and the new ``historyId``.
+
+        Raises ``HistoryExpired`` when Gmail no longer has history that old;
+        it is usually kept for about a week.
+        """
+        message_ids: dict[str, None] = {}
+        history_id = start_history_id
+        page_token = None
+        while True:
+            try:
+                with self.profile.stage("gmail_history"):
+                    response = (
+                        self.service.users()
+                        .history()
+                        .list(
+                            userId="me",
+                            startHistoryId=start_history_id,
+                            historyTypes="messageAdded",
+                            maxResults=page_size,
+                            pageToken=page_token,
+                        )
+                        .execute()
+                    )
+            except Exception as exc:
+                if getattr(getattr(exc, "resp", None), "status", None) == 404:
+                    raise HistoryExpired(
+                        f"Gmailの履歴 (historyId {start_history_id}) は保存期間を過ぎています。"
+                    ) from exc
+                raise
+            self.profile.count("gmail_api_calls")
+            for record in response.get("history", []):
+                for added in record.get("messagesAdded", []):
+                    message_ids[added["message"]["id"]] = None
+            history_id = str(response.get("historyId", history_id))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return list(message_ids), history_id
+
     def get_message(self, message_id: str) -> dict:
-        return self.service.users().messages().get(userId="me", id=message_id, format="full").execute()
+        if self.cache is not None:
+            cached = self.cache.get_many([message_id])
+            if message_id in cached and cached[message_id][1] is not None:
+                return self._message_from_text(message_id, *cached[message_id])
+        with self.profile.stage("gmail_download"):
+            message = self.service.users().messages().get(userId="me", id=message_id, format="full").execute()
+        self.profile.count("gmail_api_calls")
+        self.profile.count("gmail_messages")
+        if self.cache is not None:
+            self.cache.put_many({message_id: (self._get_subject(message), self._decode_body(message))})
+        return message
+
+    def get_messages(
+        self, message_ids: Iterable[str], format: str = "full", **params: Any
+    ) -> dict[str, dict]:
+        """Fetch many messages through Gmail batch requests, keyed by message id."""
+        messages = self.service.users().messages()
+        requests = {
+            message_id: (
+                lambda message_id=message_id: messages.get(
+                    userId="me", id=message_id, format=format, **params
+                )
+            )
+            for message_id in dict.fromkeys(message_ids)
+        }
+        if not requests:
+            return {}
+        with self.profile.stage("gmail_download"):
+            messages = self._execute_batch(requests)
+        self.profile.count("gmail_messages", len(messages))
+        return messages
+
+    def _execute_batch(self, requests: dict[str, Callable[[], Any]]) -> dict[str, dict]:
+        results: dict[str, dict] = {}
+        pending = dict(requests)
+        size = max(1, min(self.config.batch_size, BATCH_LIMIT))
+        for attempt in range(self.config.batch_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                self.profile.count("gmail_retries", len(pending))
+                time.sleep(self.config.retry_wait_seconds * 2 ** (attempt - 1))
+            failed: dict[str, Callable[[], Any]] = {}
+
+            def callback(request_id: str, response: dict, exception: Exception | None) -> None:
+                if exception is None:
+                    results[request_id] = response
+                    return
+                status = getattr(getattr(exception, "resp", None), "status", None)
+                if status == 404:
+                    # 削除済みのメッセージなどは結果から除外する
+                    return
+                if _is_retryable(exception):
+                    failed[request_id] = pending[request_id]
+                    return
+                raise exception
+
+            keys = list(pending)
+            for offset in range(0, len(keys), size):
+                batch = self.service.new_batch_http_request(callback=callback)
+                for key in keys[offset : offset + size]:
+                    batch.add(pending[key](), request_id=key)
+                batch.execute()
+                self.profile.count("gmail_batches")
+            self.profile.count("gmail_api_calls", len(keys))
+            pending = failed
+
+        # バッチでの再試行を使い切ったものは個別に取得する
+        for key, factory in pending.items():
+            self.profile.count("gmail_retries")
+            self.profile.count("gmail_api_calls")
+            results[key] = factory().execute(num_retries=self.config.batch_retries)
+        return results
 
     @staticmethod
-    def _get_subject(message: dict) -> str:
+    def _get_header(message: dict, name: str) -> str:
         headers = message.get("payload", {}).get("headers", [])
         for header in headers:
-            if header.get("name", "").lower() == "subject":
+            if header.get("name", "").lower() == name:
                 return header.get("value", "")
         return ""
 
+    @classmethod
+    def _get_subject(cls, message: dict) -> str:
+        return cls._get_header(message, "subject")
+
+    def _is_from_sender(self, message: dict) -> bool:
+        senders = [sender.lower() for sender in SENDER_PATTERN.findall(self.config.sender_query)]
+        sender = self._get_header(message, "from").lower()
+        return not senders or any(expected in sender for expected in senders)
+
+    @staticmethod
+    def _message_from_text(message_id: str, subject: str, body: str) -> dict:
+        return {
+            "id": message_id,
+            "payload": {
+                "headers": [{"name": "Subject", "value": subject}],
+                "body": {"data": base64.urlsafe_b64encode(body.encode("utf-8")).decode("ascii")},
+            },
+        }
+
     @staticmethod
     def _decode_body(message: dict) -> str:
         payload = message.get("payload", {})
@@ -86,49 +379,307 @@ class GmailClient:
 
         return base64.urlsafe_b64decode(body_data).decode("utf-8", errors="ignore")
 
+    def _fetch_subjects(self, message_ids: Iterable[str]) -> dict[str, Tuple[str, Optional[str]]]:
+        """Return ``(subject, body)`` per message; ``body`` is None until it has been downloaded."""
+        message_ids = list(dict.fromkeys(message_ids))
+        texts = self.cache.get_many(message_ids) if self.cache is not None else {}
+        self.profile.count("gmail_cache_hits", len(texts))
+        fetched: dict[str, Tuple[str, Optional[str]]] = {
+            message_id: (self._get_subject(message), None)
+            for message_id, message in self.get_messages(
+                (message_id for message_id in message_ids if message_id not in texts),
+                format="metadata",
+                metadataHeaders=["Subject"],
+                fields=METADATA_FIELDS,
+            ).items()
+        }
+        if self.cache is not None:
+            self.cache.put_many(fetched)
+        texts.update(fetched)
+        return texts
+
+    def _fetch_bodies(
+        self, message_ids: Iterable[str], texts: dict[str, Tuple[str, Optional[str]]]
+    ) -> None:
+        fetched = {
+            message_id: (texts[message_id][0], self._decode_body(message))
+            for message_id, message in self.get_messages(message_ids, fields=BODY_FIELDS).items()
+        }
+        self.profile.count("gmail_bytes", sum(len(body.encode("utf-8")) for _, body in fetched.values()))
+        if self.cache is not None:
+            self.cache.put_many(fetched)
+        texts.update(fetched)
+
+    @staticmethod
+    def _resolve(
+        detector: "StatusDetector", subject: str, body: Optional[str]
+    ) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        if body is None:
+            return detector.detect_subject(subject)
+        return detector.detect(subject, body)
+
+    def prefetch(
+        self, after: datetime, before: datetime, detector: "StatusDetector | None" = None
+    ) -> int:
+        """List every Amazon mail in the window once and index it by order number.
+
+        While the index is loaded, ``find_statuses`` answers from it instead of
+        searching Gmail per order. With a ``detector``, bodies are only downloaded
+        for mails whose subject lacks the order number or does not decide the
+        status. Returns the number of indexed messages.
+        """
+        with self.profile.stage("gmail_prefetch"):
+            query = f"{self.config.sender_query} after:{after:%Y/%m/%d} before:{before:%Y/%m/%d}"
+            message_ids = [meta["id"] for meta in self.list_messages(query)]
+            texts = self._fetch_subjects(message_ids)
+            self._fetch_bodies(
+                [
+                    message_id
+                    for message_id, (subject, body) in texts.items()
+                    if body is None
+                    and (
+                        detector is None
+                        or not ORDER_NUMBER_PATTERN.search(subject)
+                        or detector.detect_subject(subject) is None
+                    )
+                ],
+                texts,
+            )
+        index: dict[str, list[str]] = {}
+        for message_id in message_ids:
+            if message_id not in texts:
+                continue
+            subject, body = texts[message_id]
+            for order_number in dict.fromkeys(ORDER_NUMBER_PATTERN.findall(f"{subject}\n{body or ''}")):
+                index.setdefault(order_number, []).append(message_id)
+        self._order_index = index
+        self._prefetched = texts
+        return len(texts)
+
+    def detect_new_mails(
+        self, message_ids: Sequence[str], detector: "StatusDetector"
+    ) -> dict[str, Tuple[str, Optional[str], Optional[str]]]:
+        """Detect the status each new Amazon mail reports, keyed by order number.
+
+        ``message_ids`` are expected oldest first, so a later mail about the
+        same order wins. Mails from other senders are dropped after a
+        metadata-only fetch; bodies are downloaded as in ``prefetch``.
+        """
+        texts: dict[str, Tuple[str, Optional[str]]] = {
+            message_id: (self._get_subject(message), None)
+            for message_id, message in self.get_messages(
+                message_ids,
+                format="metadata",
+                metadataHeaders=["Subject", "From"],
+                fields=METADATA_FIELDS,
+            ).items()
+            if self._is_from_sender(message)
+        }
+        if self.cache is not None:
+            self.cache.put_many(texts)
+        self._fetch_bodies(
+            [
+                message_id
+                for message_id, (subject, _) in texts.items()
+                if not ORDER_NUMBER_PATTERN.search(subject) or detector.detect_subject(subject) is None
+            ],
+            texts,
+        )
+
+        detect_started = time.perf_counter()
+        statuses: dict[str, Tuple[str, Optional[str], Optional[str]]] = {}
+        for message_id in message_ids:
+            if message_id not in texts:
+                continue
+            subject, body = texts[message_id]
+            result = self._resolve(detector, subject, body)
+            if result is None or not result[0]:
+                continue
+            for order_number in dict.fromkeys(ORDER_NUMBER_PATTERN.findall(f"{subject}\n{body or ''}")):
+                statuses[order_number] = result
+        self.profile.add_time("status_detect", time.perf_counter() - detect_started)
+        return statuses
+
     def find_status(self, order_number: str, detector: "StatusDetector") -> Tuple[str, Optional[str], Optional[str]]:
-        for message_meta in self.search_messages(f'"{order_number}"', max_results=5):
-            message = self.get_message(message_meta["id"])
-            subject = self._get_subject(message)
-            body = self._decode_body(message)
-            status, box, pin = detector.detect(subject, body)
-            if status:
-                return status, box, pin
-        return "", None, None
+        return self.find_statuses([order_number], detector)[order_number]
+
+    def find_statuses(
+        self, order_numbers: Iterable[str], detector: "StatusDetector"
+    ) -> dict[str, Tuple[str, Optional[str], Optional[str]]]:
+        """Resolve many orders from the prefetched index, or with one batched search and fetch."""
+        order_numbers = list(dict.fromkeys(order_numbers))
+        if self._order_index is not None:
+            candidates = {
+                order_number: self._order_index.get(order_number, []) for order_number in order_numbers
+            }
+            texts = self._prefetched
+        else:
+            candidates = self._search_candidates(order_numbers)
+            texts = self._fetch_subjects(
+                message_id for message_ids in candidates.values() for message_id in message_ids
+            )
+
+        # 件名で判定できないメールのうち、判定済みのメールより前にあるものだけ本文を取得する
+        needs_body: list[str] = []
+        detect_started = time.perf_counter()
+        for message_ids in candidates.values():
+            for message_id in message_ids:
+                if message_id not in texts:
+                    continue
+                result = self._resolve(detector, *texts[message_id])
+                if result is None:
+                    needs_body.append(message_id)
+                elif result[0]:
+                    break
+        self.profile.add_time("status_detect", time.perf_counter() - detect_started)
+        if needs_body:
+            self._fetch_bodies(dict.fromkeys(needs_body), texts)
+
+        detect_started = time.perf_counter()
+        statuses: dict[str, Tuple[str, Optional[str], Optional[str]]] = {}
+        for order_number, message_ids in candidates.items():
+            statuses[order_number] = "", None, None
+            for message_id in message_ids:
+                if message_id not in texts:
+                    continue
+                result = self._resolve(detector, *texts[message_id])
+                if result is not None and result[0]:
+                    statuses[order_number] = result
+                    break
+        self.profile.add_time("status_detect", time.perf_counter() - detect_started)
+        return statuses
+
+    def _search_candidates(self, order_numbers: list[str]) -> dict[str, list[str]]:
+        messages = self.service.users().messages()
+        with self.profile.stage("gmail_search"):
+            searches = self._execute_batch(
+                {
+                    order_number: (
+                        lambda order_number=order_number: messages.list(
+                            userId="me", q=f'"{order_number}"', maxResults=5
+                        )
+                    )
+                    for order_number in order_numbers
+                }
+            )
+        return {
+            order_number: [meta["id"] for meta in searches.get(order_number, {}).get("messages", [])]
+            for order_number in order_numbers
+        }
+
+
+DEFAULT_STATUS_KEYWORDS: dict[str, tuple[str, ...]] = {
+    "キャンセル": ("ご注文のキャンセル",),
+    "注文済": ("注文済み:",),
+    "配達中": ("発送済み",),
+    "返金": ("返金", "返金の確認"),
+    "宅配ボックス": ("宅配ボックスに配達しました",),
+}
+# 件名に現れれば本文を見なくても確定できるステータス
+DEFAULT_SUBJECT_STATUSES = ("キャンセル", "注文済", "配達中")
+LOCKER_STATUS = "宅配ボックス"
+
+# ステータス以外に同じ走査で拾う語句
+_ARRIVED = "arrived"
+_DELIVERED = "delivered"
+_BOX_LABEL = "box"
+_PIN_LABEL = "pin"
+_MARKER_TERMS = {
+    "到着": _ARRIVED,
+    "お届け済": _DELIVERED,
+    "配達済": _DELIVERED,
+    "ボックス番号": _BOX_LABEL,
+    "暗証番号": _PIN_LABEL,
+}
 
 
 class StatusDetector:
-    def __init__(self):
+    """Detect the order status from a mail with one compiled scan over its text.
+
+    Every configured keyword goes into a single longest-first alternation. The
+    scan resumes one character after each hit, and a hit also counts for any
+    shorter term it contains, so the result matches a separate substring test
+    per keyword.
+    """
+
+    def __init__(
+        self,
+        status_keywords: dict[str, Sequence[str]] | None = None,
+        subject_statuses: Iterable[str] | None = None,
+    ):
         self.status_keywords: dict[str, tuple[str, ...]] = {
-            "キャンセル": ("ご注文のキャンセル",),
-            "注文済": ("注文済み:",),
-            "配達中": ("発送済み",),
-            "返金": ("返金", "返金の確認"),
-            "宅配ボックス": ("宅配ボックスに配達しました",),
+            status: tuple(keywords)
+            for status, keywords in (status_keywords or DEFAULT_STATUS_KEYWORDS).items()
         }
+        self.subject_statuses: frozenset[str] = frozenset(
+            DEFAULT_SUBJECT_STATUSES if subject_statuses is None else subject_statuses
+        )
+        self._priority = {status: rank for rank, status in enumerate(self.status_keywords)}
+
+        tags: dict[str, set[str]] = {}
+        for status, keywords in self.status_keywords.items():
+            for keyword in keywords:
+                if keyword:
+                    tags.setdefault(keyword, set()).add(status)
+        for term, tag in _MARKER_TERMS.items():
+            tags.setdefault(term, set()).add(tag)
+        terms = sorted(tags, key=len, reverse=True)
+        self._tags: dict[str, frozenset[str]] = {
+            term: frozenset().union(*(tags[other] for other in terms if other in term))
+            for term in terms
+        }
+        self._pattern = re.compile("|".join(re.escape(term) for term in terms))
+
+    def _scan(self, text: str) -> dict[str, list[int]]:
+        positions: dict[str, list[int]] = {}
+        search = self._pattern.search
+        match = search(text)
+        while match is not None:
+            start = match.start()
+            for tag in self._tags[match.group()]:
+                positions.setdefault(tag, []).append(start)
+            match = search(text, start + 1)
+        return positions
+
+    def _first_status(self, positions: dict[str, list[int]]) -> Optional[str]:
+        matched = [status for status in positions if status in self._priority]
+        return min(matched, key=self._priority.__getitem__) if matched else None
+
+    def detect_subject(self, subject: str) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """Decide the status from the subject alone, or return None when the body is needed."""
+        status = self._first_status(self._scan(subject))
+        if status in self.subject_statuses:
+            return status, None, None
+        return None
 
     def detect(self, subject: str, body: str) -> Tuple[str, Optional[str], Optional[str]]:
         text = f"{subject}\n{body}"
-        for status, keywords in self.status_keywords.items():
-            if any(keyword in text for keyword in keywords):
-                if status == "宅配ボックス":
-                    box, pin = self._extract_locker_info(body)
-                    return status, box, pin
-                return status, None, None
+        positions = self._scan(text)
+        status = self._first_status(positions)
+        if status == LOCKER_STATUS:
+            body_start = len(subject) + 1
+            box = self._value_after(text, positions.get(_BOX_LABEL, ()), body_start)
+            pin = self._value_after(text, positions.get(_PIN_LABEL, ()), body_start)
+            return status, box, pin
+        if status:
+            return status, None, None
 
-        if "到着" in text and ("お届け済" in text or "配達済" in text):
+        if _ARRIVED in positions and _DELIVERED in positions:
             return "到着済", None, None
 
         return "", None, None
 
     @staticmethod
-    def _extract_locker_info(body: str) -> Tuple[Optional[str], Optional[str]]:
-        box = None
-        pin = None
-        lines = [line.strip() for line in body.splitlines() if line.strip()]
-        for index, line in enumerate(lines):
-            if "ボックス番号" in line and index + 1 < len(lines):
-                box = lines[index + 1]
-            if "暗証番号" in line and index + 1 < len(lines):
-                pin = lines[index + 1]
-        return box, pin
+    def _value_after(text: str, positions: Sequence[int], body_start: int) -> Optional[str]:
+        # ラベルを含む行のうち最後のものについて、次の空でない行を値とする
+        for position in reversed(positions):
+            if position < body_start:
+                break
+            end = text.find("\n", position)
+            while end != -1:
+                start = end + 1
+                end = text.find("\n", start)
+                line = text[start : end if end != -1 else len(text)].strip()
+                if line:
+                    return line
+        return None
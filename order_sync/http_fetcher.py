@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterator
+
+from .amazon import AmazonConfig, AmazonOrderFetcher, HistoryPage, PageSizeMismatch, check_page_size
+from .models import Order
+from .profiling import RunProfile
+
+if TYPE_CHECKING:
+    import requests
+
+    from .archive import RunArchive
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+)
+
+
+class SigninRequired(RuntimeError):
+    """Raised when Amazon redirects a history request to the sign-in page."""
+
+
+class HttpOrderFetcher:
+    """Fetch order history pages over plain HTTP with the cookies saved by Selenium.
+
+    Pages of each year are requested concurrently by ``startIndex`` offset and
+    parsed with ``AmazonOrderFetcher``'s parser. If Amazon asks for a sign-in
+    before any page was produced, the Selenium ``fallback`` takes over. If a
+    page does not hold ``orders_per_page`` orders, the ``fallback`` pages
+    through the history one page at a time and skips the orders already
+    yielded.
+    """
+
+    def __init__(
+        self,
+        config: AmazonConfig | None = None,
+        max_workers: int = 4,
+        user_agent: str = DEFAULT_USER_AGENT,
+        fallback: AmazonOrderFetcher | None = None,
+        profile: RunProfile | None = None,
+        archive: RunArchive | None = None,
+    ):
+        self.config = config or AmazonConfig()
+        self.max_workers = max(1, max_workers)
+        self.user_agent = user_agent
+        self.fallback = fallback
+        self.profile = profile or RunProfile()
+        self.archive = archive
+        self.parser = fallback or AmazonOrderFetcher(self.config, profile=self.profile)
+        self.page_load_times: list[float] = []
+
+    def _create_session(self) -> requests.Session:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        if not self.config.cookie_file.exists():
+            raise SigninRequired(f"クッキーファイルが見つかりません: {self.config.cookie_file}")
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(
+            {
+                "User-Agent": self.user_agent,
+                "Accept-Language": "ja-JP,ja;q=0.9",
+            }
+        )
+        with self.config.cookie_file.open("r", encoding="utf-8") as handle:
+            cookies = json.load(handle)
+        for cookie in cookies:
+            session.cookies.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain", ""),
+                path=cookie.get("path", "/"),
+            )
+        return session
+
+    def _fetch_page(
+        self,
+        session: requests.Session,
+        year: int,
+        index: int,
+        start_date: datetime,
+        end_date: datetime,
+    ) -> HistoryPage:
+        started = time.perf_counter()
+        response = session.get(
+            self.parser._year_url(year, index * self.config.orders_per_page), timeout=30
+        )
+        elapsed = time.perf_counter() - started
+        self.page_load_times.append(elapsed)
+        self.profile.add_time("page_load", elapsed)
+        self.profile.count("amazon_bytes", len(response.content))
+        if "signin" in response.url:
+            raise SigninRequired("Amazonのセッションが切れています。")
+        response.raise_for_status()
+        if self.archive is not None:
+            self.archive.put_page(year, index, response.text)
+        return self.parser.parse_page(response.text, start_date, end_date)
+
+    def _iter_http_pages(
+        self, start_date: datetime, end_date: datetime, seen: set[str]
+    ) -> Iterator[list[Order]]:
+        session = self._create_session()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for year in range(end_date.year, start_date.year - 1, -1):
+                    index = 0
+                    while True:
+                        futures = [
+                            executor.submit(
+                                self._fetch_page, session, year, index + offset, start_date, end_date
+                            )
+                            for offset in range(self.max_workers)
+                        ]
+                        index += self.max_workers
+                        year_done = False
+                        for future in futures:
+                            page = future.result()
+                            check_page_size(page, self.config.orders_per_page)
+                            seen.update(order.order_number for order in page.orders)
+                            yield page.orders
+                            if page.order_dates and min(page.order_dates) < start_date:
+                                return
+                            # 通常の取得と同じく、次のページへのリンクがなくなったら年を終える
+                            if not page.next_href:
+                                year_done = True
+                                break
+                        if year_done:
+                            for future in futures:
+                                future.cancel()
+                            break
+        finally:
+            session.close()
+
+    def iter_pages(self, start_date: datetime, end_date: datetime) -> Iterator[list[Order]]:
+        produced = False
+        seen: set[str] = set()
+        try:
+            for orders in self._iter_http_pages(start_date, end_date, seen):
+                produced = True
+                yield orders
+        except SigninRequired:
+            if produced or self.fallback is None:
+                raise
+            print("HTTPでの取得にはログインが必要なため、ブラウザでの取得に切り替えます。")
+            yield from self.fallback.iter_pages(start_date, end_date)
+        except PageSizeMismatch as exc:
+            if self.fallback is None:
+                raise
+            print(f"{exc} ページを順にたどるブラウザでの取得に切り替えます。")
+            for orders in self.fallback.iter_pages(start_date, end_date):
+                yield [order for order in orders if not order.order_number or order.order_number not in seen]
+
+    def iter_orders(self, start_date: datetime, end_date: datetime) -> Iterator[Order]:
+        for page in self.iter_pages(start_date, end_date):
+            yield from page
+
+    def fetch_orders(self, start_date: datetime, end_date: datetime) -> list[Order]:
+        return list(self.iter_orders(start_date, end_date))
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+
+from .models import OrderRecord, StatusUpdate, arrival_overrides_status
+from .profiling import RunProfile
+
+
+class JsonlWriter:
+    """Append records to a JSON Lines file, one object per item row.
+
+    The file is never rewritten: each run appends its records with a
+    ``synced_at`` timestamp, so consumers can read only the lines added since
+    their last offset. The latest line for an (account, order number, title)
+    wins.
+    """
+
+    def __init__(
+        self,
+        output_file: Path = Path("orders.jsonl"),
+        flush_seconds: float = 1.0,
+        profile: RunProfile | None = None,
+    ):
+        self.output_file = output_file
+        self.flush_seconds = flush_seconds
+        self.profile = profile or RunProfile()
+
+    def write(self, records: Iterable[OrderRecord], upsert: bool = False) -> int:
+        """Append ``records`` and return the number of lines written.
+
+        ``upsert`` is accepted for symmetry with the other writers; appending
+        already lets later lines supersede earlier ones.
+        """
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        synced_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        count = 0
+        elapsed = 0.0
+        with self.output_file.open("a", encoding="utf-8") as handle:
+            last_flush = time.monotonic()
+            for record in records:
+                started = time.perf_counter()
+                handle.write(json.dumps({**record.as_dict(), "synced_at": synced_at}, ensure_ascii=False))
+                handle.write("\n")
+                count += 1
+                if time.monotonic() - last_flush >= self.flush_seconds:
+                    handle.flush()
+                    last_flush = time.monotonic()
+                elapsed += time.perf_counter() - started
+            started = time.perf_counter()
+            handle.flush()
+            os.fsync(handle.fileno())
+            elapsed += time.perf_counter() - started
+        self.profile.add_time("jsonl_write", elapsed)
+        self.profile.count("jsonl_rows", count)
+        return count
+
+    def update_statuses(self, updates: Iterable[StatusUpdate]) -> int:
+        """Append updated copies of the latest lines of the orders in ``updates``.
+
+        Returns the number of lines appended. Lines whose arrival already
+        reads 到着済 keep that status, as in a full run.
+        """
+        by_order = {(update.account, update.order_number): update for update in updates}
+        if not by_order or not self.output_file.exists():
+            return 0
+        started = time.perf_counter()
+        latest: dict[tuple[str, str, str], dict] = {}
+        with self.output_file.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if (row.get("account", ""), row.get("order_number", "")) in by_order:
+                    latest[(row.get("account", ""), row.get("order_number", ""), row.get("title", ""))] = row
+        synced_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        lines: list[str] = []
+        for (account, order_number, _), row in latest.items():
+            update = by_order[(account, order_number)]
+            if arrival_overrides_status(row.get("arrival", "")):
+                continue
+            values = {
+                "status": update.status,
+                "locker_message": update.locker_message,
+                "template_message": update.template_message,
+            }
+            if all(row.get(name) == value for name, value in values.items()):
+                continue
+            lines.append(json.dumps({**row, **values, "synced_at": synced_at}, ensure_ascii=False) + "\n")
+        if lines:
+            with self.output_file.open("a", encoding="utf-8") as handle:
+                handle.writelines(lines)
+                handle.flush()
+                os.fsync(handle.fileno())
+        self.profile.add_time("jsonl_write", time.perf_counter() - started)
+        self.profile.count("status_updates", len(lines))
+        return len(lines)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+# テーブル定義を変更したら上げる。古いキャッシュは破棄して作り直す
+SCHEMA_VERSION = 2
+
+
+class MessageCache:
+    """On-disk cache of Gmail message subjects and decoded bodies, keyed by message id.
+
+    The body is NULL for messages whose subject was enough to decide the status.
+    """
+
+    def __init__(
+        self,
+        path: Path = Path("gmail_cache.sqlite3"),
+        max_entries: int = 50000,
+        max_age_days: float = 365.0,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        # 行数の見積もり。上書きも加算するので実際より多めになるが、超えたら evict で数え直す
+        self._entries = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._connection:
+            (version,) = self._connection.execute("PRAGMA user_version").fetchone()
+            if version != SCHEMA_VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS messages")
+                self._connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id TEXT PRIMARY KEY, subject TEXT NOT NULL, body TEXT, fetched_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS messages_fetched_at ON messages (fetched_at)"
+            )
+        self.evict()
+
+    def get_many(self, message_ids: Iterable[str]) -> dict[str, Tuple[str, Optional[str]]]:
+        message_ids = list(dict.fromkeys(message_ids))
+        found: dict[str, Tuple[str, Optional[str]]] = {}
+        with self._lock:
+            # SQLite のプレースホルダ上限に収まるよう分割して問い合わせる
+            for offset in range(0, len(message_ids), 500):
+                chunk = message_ids[offset : offset + 500]
+                rows = self._connection.execute(
+                    f"SELECT id, subject, body FROM messages WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for message_id, subject, body in rows:
+                    found[message_id] = subject, body
+            self.hits += len(found)
+            self.misses += len(message_ids) - len(found)
+        return found
+
+    def put_many(self, texts: dict[str, Tuple[str, Optional[str]]]) -> None:
+        if not texts:
+            return
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO messages (id, subject, body, fetched_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET subject = excluded.subject, "
+                "body = COALESCE(excluded.body, messages.body), fetched_at = excluded.fetched_at",
+                [(message_id, subject, body, now) for message_id, (subject, body) in texts.items()],
+            )
+            self._entries += len(texts)
+            over_limit = self._entries > self.max_entries
+        # watch のように開きっぱなしで使う場合も上限を超えたらその場で削る
+        if over_limit:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop entries older than ``max_age_days`` and the oldest beyond ``max_entries``."""
+        cutoff = time.time() - self.max_age_days * 86400
+        with self._lock, self._connection:
+            removed = self._connection.execute(
+                "DELETE FROM messages WHERE fetched_at < ?", (cutoff,)
+            ).rowcount
+            removed += self._connection.execute(
+                "DELETE FROM messages WHERE id IN ("
+                "SELECT id FROM messages ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            (self._entries,) = self._connection.execute("SELECT COUNT(*) FROM messages").fetchone()
+        return removed
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            (entries,) = self._connection.execute("SELECT COUNT(*) FROM messages").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -2,16 +2,38 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 
+# 出力する列の順序 (OrderRecord の属性名)
+RECORD_FIELDS = (
+    "order_date",
+    "price",
+    "delivery_name",
+    "delivery_address",
+    "title",
+    "quantity",
+    "order_number",
+    "arrival",
+    "status",
+    "locker_message",
+    "template_message",
+    "account",
+)
+# 到着日に「到着済」とある注文は、メールから判定したステータスより優先する
+ARRIVED_STATUS = "到着済"
 
-@dataclass
+
+def arrival_overrides_status(arrival: str) -> bool:
+    return arrival != "不明" and ARRIVED_STATUS in arrival
+
+
+@dataclass(slots=True)
 class OrderItem:
     title: str
     quantity: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Order:
     order_date: datetime
     order_number: str
@@ -22,16 +44,66 @@ class Order:
     items: list[OrderItem] = field(default_factory=list)
 
 
-@dataclass
-class OrderRecord:
+@dataclass(slots=True)
+class OrderDetails:
+    """Per-order output fields, stored once and shared by every item row of the order."""
+
     order_date: str
     price: str
     delivery_name: str
     delivery_address: str
+    order_number: str
+    arrival: str
+    status: str
+    locker_message: str
+    template_message: Optional[str] = None
+    account: str = ""
+
+
+def _details_property(name: str) -> property:
+    return property(lambda record: getattr(record.details, name))
+
+
+@dataclass(slots=True)
+class OrderRecord:
+    details: OrderDetails
     title: str
     quantity: str
+
+    order_date = _details_property("order_date")
+    price = _details_property("price")
+    delivery_name = _details_property("delivery_name")
+    delivery_address = _details_property("delivery_address")
+    order_number = _details_property("order_number")
+    arrival = _details_property("arrival")
+    status = _details_property("status")
+    locker_message = _details_property("locker_message")
+    template_message = _details_property("template_message")
+    account = _details_property("account")
+
+    def as_dict(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in RECORD_FIELDS}
+
+    @classmethod
+    def from_dict(cls, values: dict[str, Any], previous: OrderRecord | None = None) -> OrderRecord:
+        """Rebuild a record from ``as_dict()``, sharing ``previous``'s details when it is the same order."""
+        details = previous.details if previous is not None else None
+        if details is None or (details.account, details.order_number) != (
+            values["account"],
+            values["order_number"],
+        ):
+            details = OrderDetails(
+                **{name: values[name] for name in RECORD_FIELDS if name not in ("title", "quantity")}
+            )
+        return cls(details, title=values["title"], quantity=values["quantity"])
+
+
+@dataclass(slots=True)
+class StatusUpdate:
+    """A status detected from a new mail, applied to the rows of an order already written."""
+
     order_number: str
-    arrival: str
     status: str
     locker_message: str
     template_message: Optional[str] = None
+    account: str = ""
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import queue
+import threading
+from datetime import datetime
+from typing import Iterator, List
+
+from .amazon import AmazonOrderFetcher
+from .models import OrderRecord
+from .processing import OrderProcessor
+
+
+def iter_pipelined(
+    fetcher: AmazonOrderFetcher,
+    processor: OrderProcessor,
+    start_date: datetime,
+    end_date: datetime,
+    workers: int = 4,
+    queue_size: int = 4,
+    prefetch_window: tuple[datetime, datetime] | None = None,
+) -> Iterator[OrderRecord]:
+    """Resolve Gmail statuses on worker threads while later history pages are still loading.
+
+    Each parsed page is queued with its sequence number. Records are yielded
+    in page order as soon as every earlier page is done, so the output matches
+    the sequential run.
+    """
+    workers = max(1, workers)
+    pages: queue.Queue = queue.Queue(maxsize=queue_size)
+    results: dict[int, List[OrderRecord]] = {}
+    errors: list[BaseException] = []
+    page_count: list[int] = []
+    stop = threading.Event()
+    ready = threading.Condition()
+
+    def fail(exc: BaseException) -> None:
+        with ready:
+            errors.append(exc)
+            stop.set()
+            ready.notify_all()
+
+    def produce() -> None:
+        page_iter = fetcher.iter_pages(start_date, end_date)
+        sequence = 0
+        try:
+            for page in page_iter:
+                if stop.is_set():
+                    break
+                pages.put((sequence, page))
+                sequence += 1
+        except BaseException as exc:
+            fail(exc)
+        finally:
+            page_iter.close()
+            with ready:
+                page_count.append(sequence)
+                ready.notify_all()
+            for _ in range(workers):
+                pages.put(None)
+
+    def consume() -> None:
+        while True:
+            item = pages.get()
+            if item is None:
+                return
+            if stop.is_set():
+                # 停止後もキューを空にして、取得側がブロックしないようにする
+                continue
+            sequence, page = item
+            try:
+                page_records = processor.process_orders(page)
+            except BaseException as exc:
+                fail(exc)
+                continue
+            with ready:
+                results[sequence] = page_records
+                ready.notify_all()
+
+    producer = threading.Thread(target=produce, name="amazon-pages", daemon=True)
+    producer.start()
+    try:
+        if prefetch_window is not None:
+            processor.prefetch(*prefetch_window)
+    except BaseException as exc:
+        fail(exc)
+
+    consumers = [
+        threading.Thread(target=consume, name=f"gmail-worker-{index}", daemon=True)
+        for index in range(workers)
+    ]
+    for consumer in consumers:
+        consumer.start()
+
+    try:
+        next_sequence = 0
+        while True:
+            with ready:
+                ready.wait_for(
+                    lambda: errors
+                    or next_sequence in results
+                    or (page_count and next_sequence >= page_count[0])
+                )
+                if errors:
+                    raise errors[0]
+                if next_sequence not in results:
+                    break
+                page_records = results.pop(next_sequence)
+            yield from page_records
+            next_sequence += 1
+    finally:
+        stop.set()
+        for consumer in consumers:
+            consumer.join()
+        producer.join()
+
+
+def run_pipelined(
+    fetcher: AmazonOrderFetcher,
+    processor: OrderProcessor,
+    start_date: datetime,
+    end_date: datetime,
+    workers: int = 4,
+    queue_size: int = 4,
+    prefetch_window: tuple[datetime, datetime] | None = None,
+) -> List[OrderRecord]:
+    return list(
+        iter_pipelined(
+            fetcher,
+            processor,
+            start_date,
+            end_date,
+            workers=workers,
+            queue_size=queue_size,
+            prefetch_window=prefetch_window,
+        )
+    )
@@ -1,11 +1,21 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from typing import Iterable, List
-
-from dateutil import parser as date_parser
-
-from .models import Order, OrderRecord
+import sys
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+from .arrival import ArrivalParser
+from .models import (
+    ARRIVED_STATUS,
+    Order,
+    OrderDetails,
+    OrderRecord,
+    StatusUpdate,
+    arrival_overrides_status,
+)
+from .profiling import RunProfile
+from .state_store import OrderState, OrderStateStore
 
 DATE_FORMAT = "%Y-%m-%d"
 LOCKER_TEMPLATE = """お世話になっております。
@@ -24,43 +34,29 @@ LOCKER_TEMPLATE = """お世話になっております。
 こちらお試し頂けますでしょうか。
 どうぞよろしくお願いいたします。"""
 
-ARRIVAL_KEYWORDS = (
-    ("お届け済み", "到着済"),
-    ("配達済み", "到着済"),
-    ("お届け予定", "到着予定"),
-    ("配達予定", "到着予定"),
-)
+# 注文後に届く発送・配達メールも拾えるよう、先読みの終了日を延ばす日数
+PREFETCH_MARGIN_DAYS = 60
 
 
 class OrderProcessor:
-    def __init__(self, detector, gmail_client):
+    def __init__(
+        self,
+        detector,
+        gmail_client,
+        batch_size: int = 50,
+        state_store: OrderStateStore | None = None,
+        today: date | None = None,
+        profile: RunProfile | None = None,
+    ):
         self.detector = detector
         self.gmail_client = gmail_client
+        self.batch_size = batch_size
+        self.state_store = state_store
+        self.arrival_parser = ArrivalParser(today)
+        self.profile = profile or RunProfile()
 
     def _format_arrival(self, text: str) -> str:
-        text = (text or "").strip()
-        if not text:
-            return "不明"
-
-        normalized = text.replace("までにお届け", "にお届け")
-        for keyword, replacement in ARRIVAL_KEYWORDS:
-            if keyword in normalized:
-                normalized = normalized.replace("にお届け済み", "到着済")
-                normalized = normalized.replace(keyword, replacement)
-                break
-
-        explicit_date = self._extract_explicit_date(normalized)
-        if explicit_date:
-            suffix = "到着済" if "到着済" in normalized else "到着予定"
-            return f"{explicit_date.month}月{explicit_date.day}日{suffix}"
-
-        relative = self._resolve_relative_date(normalized)
-        if relative:
-            return relative
-
-        if "到着" in normalized:
-            return normalized
-        return "不明"
+        return self.arrival_parser.format(text)
 
     def _format_date(self, date: datetime) -> str:
         return date.strftime(DATE_FORMAT)
@@ -70,96 +66,107 @@ class OrderProcessor:
             return None
         return LOCKER_TEMPLATE.format(box=box or "不明", pin=pin or "不明")
 
-    def process_orders(self, orders: Iterable[Order]) -> List[OrderRecord]:
-        records: List[OrderRecord] = []
-        for order in orders:
-            arrival = self._format_arrival(order.arrival_raw)
-            status = ""
-            box = None
-            pin = None
-            if order.order_number:
-                status, box, pin = self.gmail_client.find_status(order.order_number, self.detector)
-            if arrival != "不明" and "到着済" in arrival:
-                status = "到着済"
-            for item in order.items or [None]:
-                title = item.title if item else ""
-                quantity = item.quantity if item else "1"
-                locker_message = ""
-                template = None
-                if status == "宅配ボックス":
-                    locker_parts: list[str] = []
-                    if box:
-                        locker_parts.append(f"ボックス番号: {box}")
-                    if pin:
-                        locker_parts.append(f"暗証番号: {pin}")
-                    locker_message = "、".join(locker_parts) if locker_parts else "情報なし"
-                    template = self._build_template(box, pin)
-                elif box or pin:
-                    locker_parts = []
-                    if box:
-                        locker_parts.append(f"ボックス番号: {box}")
-                    if pin:
-                        locker_parts.append(f"暗証番号: {pin}")
-                    locker_message = "、".join(locker_parts)
-                    template = self._build_template(box, pin)
-
-                records.append(
-                    OrderRecord(
-                        order_date=self._format_date(order.order_date),
-                        price=order.price,
-                        delivery_name=order.delivery_name,
-                        delivery_address=order.delivery_address,
-                        title=title,
-                        quantity=quantity,
-                        order_number=order.order_number,
-                        arrival=arrival,
-                        status=status or "不明",
-                        locker_message=locker_message,
-                        template_message=template,
-                    )
+    def _locker_fields(self, status: str, box: str | None, pin: str | None) -> tuple[str, str | None]:
+        if status != "宅配ボックス" and not box and not pin:
+            return "", None
+        locker_parts: list[str] = []
+        if box:
+            locker_parts.append(f"ボックス番号: {box}")
+        if pin:
+            locker_parts.append(f"暗証番号: {pin}")
+        locker_message = "、".join(locker_parts)
+        if status == "宅配ボックス" and not locker_parts:
+            locker_message = "情報なし"
+        return locker_message, self._build_template(box, pin)
+
+    def status_update(
+        self, order_number: str, status: str, box: str | None, pin: str | None, account: str = ""
+    ) -> StatusUpdate:
+        """Build the output fields that a newly detected status changes for ``order_number``."""
+        locker_message, template = self._locker_fields(status, box, pin)
+        return StatusUpdate(
+            order_number=order_number,
+            status=status or "不明",
+            locker_message=locker_message,
+            template_message=template,
+            account=account,
+        )
+
+    def prefetch(self, start: datetime, end: datetime) -> int:
+        return self.gmail_client.prefetch(
+            start, end + timedelta(days=PREFETCH_MARGIN_DAYS), detector=self.detector
+        )
+
+    def process_orders(
+        self,
+        orders: Iterable[Order],
+        prefetch_window: tuple[datetime, datetime] | None = None,
+    ) -> List[OrderRecord]:
+        return list(self.iter_records(orders, prefetch_window=prefetch_window))
+
+    def iter_records(
+        self,
+        orders: Iterable[Order],
+        prefetch_window: tuple[datetime, datetime] | None = None,
+    ) -> Iterator[OrderRecord]:
+        """Yield records chunk by chunk while ``orders`` is still being produced."""
+        if prefetch_window is not None:
+            self.prefetch(*prefetch_window)
+        iterator = iter(orders)
+        while True:
+            chunk = list(islice(iterator, self.batch_size))
+            if not chunk:
+                break
+            order_numbers = [order.order_number for order in chunk if order.order_number]
+            # 状態が確定済みの注文はGmailを照会せず、前回の結果を使う
+            known = self.state_store.get_many(order_numbers) if self.state_store is not None else {}
+            statuses = {
+                order_number: (state.status, state.box, state.pin)
+                for order_number, state in known.items()
+                if state.is_terminal
+            }
+            statuses.update(
+                self.gmail_client.find_statuses(
+                    [order_number for order_number in order_numbers if order_number not in statuses],
+                    self.detector,
                 )
-        return records
-
-    def _extract_explicit_date(self, text: str) -> datetime | None:
-        try:
-            parsed = date_parser.parse(text, fuzzy=True)
-            return parsed
-        except (ValueError, OverflowError):
-            return None
-
-    def _resolve_relative_date(self, text: str) -> str | None:
-        base = datetime.today()
-        if "明日" in text:
-            target = base + timedelta(days=1)
-            return f"{target.month}月{target.day}日到着予定"
-        if "今日" in text:
-            return f"{base.month}月{base.day}日到着予定"
-
-        weekday_map = {
-            "月曜日": 0,
-            "月曜": 0,
-            "火曜日": 1,
-            "火曜": 1,
-            "水曜日": 2,
-            "水曜": 2,
-            "木曜日": 3,
-            "木曜": 3,
-            "金曜日": 4,
-            "金曜": 4,
-            "土曜日": 5,
-            "土曜": 5,
-            "日曜日": 6,
-            "日曜": 6,
-        }
-        for label, weekday in weekday_map.items():
-            if label in text:
-                target = self._next_weekday(base, weekday)
-                return f"{target.month}月{target.day}日到着予定"
-        return None
-
-    @staticmethod
-    def _next_weekday(base: datetime, weekday: int) -> datetime:
-        days_ahead = (weekday - base.weekday()) % 7
-        if days_ahead == 0:
-            days_ahead = 7
-        return base + timedelta(days=days_ahead)
+            )
+            states: dict[str, OrderState] = {}
+            chunk_records: List[OrderRecord] = []
+            with self.profile.stage("record_build"):
+                for order in chunk:
+                    status, box, pin = statuses.get(order.order_number, ("", None, None))
+                    order_records = self._build_records(order, status, box, pin)
+                    chunk_records.extend(order_records)
+                    if order.order_number and order_records:
+                        states[order.order_number] = OrderState(
+                            order_records[0].status, order_records[0].arrival, box, pin
+                        )
+            self.profile.count("records", len(chunk_records))
+            if self.state_store is not None:
+                self.state_store.put_many(states)
+            yield from chunk_records
+
+    def _build_records(
+        self, order: Order, status: str, box: str | None, pin: str | None
+    ) -> List[OrderRecord]:
+        arrival = self._format_arrival(order.arrival_raw)
+        if arrival_overrides_status(arrival):
+            status = ARRIVED_STATUS
+        locker_message, template = self._locker_fields(status, box, pin)
+
+        # 注文単位の値は1つにまとめ、商品ごとの行で共有する
+        details = OrderDetails(
+            order_date=self._format_date(order.order_date),
+            price=order.price,
+            delivery_name=order.delivery_name,
+            delivery_address=order.delivery_address,
+            order_number=order.order_number,
+            arrival=sys.intern(arrival),
+            status=sys.intern(status or "不明"),
+            locker_message=sys.intern(locker_message),
+            template_message=template,
+        )
+        if not order.items:
+            return [OrderRecord(details, title="", quantity="1")]
+        return [OrderRecord(details, title=item.title, quantity=item.quantity) for item in order.items]
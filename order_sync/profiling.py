@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+# 集計表に表示する順序と見出し
+STAGE_LABELS = {
+    "chrome_start": "Chrome起動",
+    "page_load": "Amazonページ読み込み",
+    "html_parse": "HTML解析",
+    "gmail_prefetch": "Gmail一括取得",
+    "gmail_history": "Gmail履歴取得",
+    "gmail_search": "Gmail検索",
+    "gmail_download": "Gmailメッセージ取得",
+    "status_detect": "ステータス判定",
+    "record_build": "レコード生成",
+    "csv_write": "CSV書き出し",
+    "sqlite_write": "SQLite書き出し",
+    "jsonl_write": "JSONL書き出し",
+}
+COUNTER_LABELS = {
+    "pages": "Amazonページ数",
+    "orders": "注文数",
+    "items": "商品数",
+    "records": "レコード数",
+    "amazon_bytes": "Amazon受信バイト数",
+    "gmail_api_calls": "Gmail API呼び出し数",
+    "gmail_batches": "Gmailバッチ数",
+    "gmail_messages": "Gmailメッセージ取得数",
+    "gmail_bytes": "Gmail本文バイト数",
+    "gmail_retries": "Gmail再試行数",
+    "gmail_cache_hits": "Gmailキャッシュヒット数",
+    "csv_rows": "CSV行数",
+    "sqlite_rows": "SQLite行数",
+    "jsonl_rows": "JSONL行数",
+    "status_updates": "ステータス更新行数",
+}
+
+
+class RunProfile:
+    """Wall time per stage and event counters collected over one run.
+
+    Components share one instance and record into it from any thread. Stage
+    times are summed per thread, so overlapping stages (``--pipeline``) can
+    add up to more than the run's wall time.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self.stages: dict[str, float] = {}
+        self.stage_calls: dict[str, int] = {}
+        self.counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, report: dict[str, Any]) -> None:
+        """Add the stages and counters of another ``report()``, e.g. from a worker process."""
+        with self._lock:
+            for name, stage in report.get("stages", {}).items():
+                self.stages[name] = self.stages.get(name, 0.0) + stage["seconds"]
+                self.stage_calls[name] = self.stage_calls.get(name, 0) + stage["calls"]
+            for name, value in report.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+
+    @property
+    def wall_seconds(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def report(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "wall_seconds": round(self.wall_seconds, 3),
+                "stages": {
+                    name: {"seconds": round(seconds, 3), "calls": self.stage_calls[name]}
+                    for name, seconds in _ordered(self.stages, STAGE_LABELS)
+                },
+                "counters": dict(_ordered(self.counters, COUNTER_LABELS)),
+            }
+
+    def write_json(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as handle:
+            json.dump(self.report(), handle, ensure_ascii=False, indent=2)
+
+    def summary(self) -> str:
+        report = self.report()
+        wall = report["wall_seconds"] or 1.0
+        lines = [
+            pad("処理", 24)
+            + pad("秒", 10, right=True)
+            + pad("割合", 8, right=True)
+            + pad("回数", 10, right=True)
+        ]
+        for name, stage in report["stages"].items():
+            lines.append(
+                f"{pad(STAGE_LABELS.get(name, name), 24)}{stage['seconds']:>10.2f}"
+                f"{stage['seconds'] / wall:>8.0%}{stage['calls']:>10}"
+            )
+        lines.append(f"{pad('全体', 24)}{report['wall_seconds']:>10.2f}")
+        lines.append("")
+        for name, value in report["counters"].items():
+            lines.append(f"{pad(COUNTER_LABELS.get(name, name), 24)}{value:>14,}")
+        return "\n".join(lines)
+
+
+def pad(text: str, width: int, right: bool = False) -> str:
+    # 全角文字は2桁として数え、表の列を揃える
+    used = sum(2 if unicodedata.east_asian_width(char) in "WF" else 1 for char in text)
+    padding = " " * max(0, width - used)
+    return padding + text if right else text + padding
+
+
+def _ordered(values: dict, labels: dict[str, str]) -> list[tuple[str, Any]]:
+    order = list(labels)
+    return sorted(
+        values.items(),
+        key=lambda item: (order.index(item[0]) if item[0] in labels else len(order), item[0]),
+    )
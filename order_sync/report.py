@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import csv
+import json
+import re
+import sqlite3
+from dataclasses import dataclass
+from datetime import date
+from itertools import islice
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+from .csv_writer import ACCOUNT_FIELD
+from .profiling import pad
+
+# 集計に使う列 (OrderRecord の属性名) と、CSVの見出し
+REPORT_FIELDS = ("order_date", "price", "delivery_name", "quantity", "order_number", "status", "account")
+CSV_HEADERS = {
+    "order_date": "年月日",
+    "price": "金額",
+    "delivery_name": "お届け先（名前）",
+    "quantity": "個数",
+    "order_number": "注文番号",
+    "status": "ステータス",
+    "account": ACCOUNT_FIELD,
+}
+IN_TRANSIT_STATUS = "配達中"
+DIGITS_PATTERN = re.compile(r"\d+")
+READ_CHUNK = 16384
+
+
+def parse_yen(text: str) -> int | None:
+    """Parse an amount such as ``￥1,980`` into yen; None when it has no digits."""
+    digits = "".join(DIGITS_PATTERN.findall(text or ""))
+    return int(digits) if digits else None
+
+
+def parse_quantity(text: str) -> int:
+    digits = "".join(DIGITS_PATTERN.findall(text or ""))
+    # 個数の表示がない商品は1個として扱う (注文履歴の表示と同じ)
+    return int(digits) if digits else 1
+
+
+class _Labels:
+    """Distinct strings of one column, in order of first appearance, and the code of every row."""
+
+    def __init__(self) -> None:
+        self.index: dict[str, int] = {}
+        self.parts: list[np.ndarray] = []
+
+    def add(self, values: Sequence[str]) -> None:
+        # 行ごとの処理を Python で書かず、dict と map の組み込み処理だけで変換する
+        index = self.index
+        new = [value for value in dict.fromkeys(values) if value not in index]
+        index.update(zip(new, range(len(index), len(index) + len(new))))
+        self.parts.append(np.fromiter(map(index.__getitem__, values), dtype=np.int64, count=len(values)))
+
+    @property
+    def labels(self) -> list[str]:
+        return list(self.index)
+
+    def codes(self) -> np.ndarray:
+        return np.concatenate(self.parts) if self.parts else np.zeros(0, dtype=np.int64)
+
+
+def _parse_day(text: str) -> np.datetime64:
+    try:
+        return np.datetime64(date.fromisoformat(text), "D")
+    except ValueError:
+        return np.datetime64("NaT", "D")
+
+
+@dataclass(slots=True)
+class OrderColumns:
+    """Orders of an export as NumPy columns, one entry per order.
+
+    The export has one row per item and repeats the order's fields on each
+    of them. Rows are read in chunks and every column is turned into integer
+    codes into its distinct strings, so only those strings stay in memory
+    and each distinct price or date text is parsed once. The rows are then
+    grouped by (account, order number) and the order fields taken from the
+    first row of each order.
+    """
+
+    rows: int
+    day: np.ndarray
+    days: np.ndarray
+    price: np.ndarray
+    priced: np.ndarray
+    items: np.ndarray
+    recipient: np.ndarray
+    recipients: list[str]
+    status: np.ndarray
+    statuses: list[str]
+    accounts: list[str]
+    order_numbers: list[str]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[str]], fields: Sequence[str] = REPORT_FIELDS) -> OrderColumns:
+        """Build the orders from item rows holding ``fields``; a missing ``account`` is read as empty."""
+        columns = {name: _Labels() for name in fields}
+        iterator = iter(rows)
+        while True:
+            chunk = list(islice(iterator, READ_CHUNK))
+            if not chunk:
+                break
+            for column, values in zip(columns.values(), zip(*chunk)):
+                column.add(values)
+        codes = {name: column.codes() for name, column in columns.items()}
+        numbers = columns["order_number"].labels
+        accounts = columns["account"].labels if "account" in columns else [""]
+        codes.setdefault("account", np.zeros(len(codes["order_number"]), dtype=np.int64))
+        keys = codes["account"] * len(numbers) + codes["order_number"]
+        if "" in numbers:
+            # 注文番号のない行はそれぞれ別の注文として数える
+            blank = codes["order_number"] == numbers.index("")
+            keys[blank] = -1 - np.flatnonzero(blank)
+        _, first_rows, order = np.unique(keys, return_index=True, return_inverse=True)
+        quantities = np.array(
+            [parse_quantity(label) for label in columns["quantity"].labels], dtype=np.int64
+        )
+        prices = [parse_yen(label) for label in columns["price"].labels]
+        price_codes = codes["price"][first_rows]
+        return cls(
+            rows=len(keys),
+            day=codes["order_date"][first_rows],
+            days=np.array(
+                [_parse_day(label) for label in columns["order_date"].labels], dtype="datetime64[D]"
+            ),
+            price=np.array([value or 0 for value in prices], dtype=np.int64)[price_codes],
+            priced=np.array([value is not None for value in prices], dtype=bool)[price_codes],
+            items=np.bincount(
+                order.reshape(-1), weights=quantities[codes["quantity"]], minlength=len(first_rows)
+            ).astype(np.int64),
+            recipient=codes["delivery_name"][first_rows],
+            recipients=columns["delivery_name"].labels,
+            status=codes["status"][first_rows],
+            statuses=columns["status"].labels,
+            accounts=[accounts[code] for code in codes["account"][first_rows].tolist()],
+            order_numbers=[numbers[code] for code in codes["order_number"][first_rows].tolist()],
+        )
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+
+def _load_csv(path: Path) -> OrderColumns:
+    with path.open("r", newline="", encoding="utf-8-sig") as handle:
+        reader = csv.reader(handle)
+        header = next(reader, None)
+        positions = {name: index for index, name in enumerate(header or [])}
+        missing = [
+            CSV_HEADERS[name]
+            for name in REPORT_FIELDS
+            if name != "account" and CSV_HEADERS[name] not in positions
+        ]
+        if missing:
+            raise RuntimeError(f"{path} に集計に必要な列がありません: {', '.join(missing)}")
+        # アカウント列のないCSV (1アカウントの出力) では全行を空のアカウントとして扱う
+        fields = [name for name in REPORT_FIELDS if CSV_HEADERS[name] in positions]
+        pick = itemgetter(*(positions[CSV_HEADERS[name]] for name in fields))
+        return OrderColumns.from_rows(map(pick, reader), fields)
+
+
+def _load_jsonl(path: Path) -> OrderColumns:
+    # 同じ (アカウント, 注文番号, 商品名) の行は後から追記されたものが有効
+    latest: dict[tuple[str, str, str], tuple[str, ...]] = {}
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            key = (row.get("account", ""), row.get("order_number", ""), row.get("title", ""))
+            latest[key] = tuple(str(row.get(name) or "") for name in REPORT_FIELDS)
+    return OrderColumns.from_rows(latest.values())
+
+
+def _load_sqlite(path: Path) -> OrderColumns:
+    connection = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        columns = ", ".join(f"COALESCE({name}, '')" for name in REPORT_FIELDS)
+        return OrderColumns.from_rows(connection.execute(f"SELECT {columns} FROM order_items"))
+    finally:
+        connection.close()
+
+
+def load_columns(path: Path, output_format: str) -> OrderColumns:
+    """Read an export written by ``CsvWriter``, ``SqliteWriter`` or ``JsonlWriter`` into columns."""
+    loaders = {"csv": _load_csv, "sqlite": _load_sqlite, "jsonl": _load_jsonl}
+    return loaders[output_format](path)
+
+
+def _table(
+    key: str, labels: Sequence[str], codes: np.ndarray, columns: OrderColumns, by: str = "spend"
+) -> list[dict[str, Any]]:
+    """Group the orders by ``codes`` and return one row per label, largest ``by`` first."""
+    values = {
+        "orders": np.bincount(codes, minlength=len(labels)),
+        "items": np.bincount(codes, weights=columns.items, minlength=len(labels)).astype(np.int64),
+        "spend": np.bincount(codes, weights=columns.price, minlength=len(labels)).astype(np.int64),
+    }
+    order = np.argsort(-values[by], kind="stable")
+    lists = {name: column.tolist() for name, column in values.items()}
+    return [{key: labels[index], **{name: lists[name][index] for name in values}} for index in order.tolist()]
+
+
+def aggregate(columns: OrderColumns, stuck_days: int = 7, as_of: date | None = None) -> dict[str, Any]:
+    """Compute the totals per day, recipient and status and the aging of orders still 配達中."""
+    days = _table("date", np.datetime_as_string(columns.days).tolist(), columns.day, columns)
+    days.sort(key=lambda row: row["date"])
+    return {
+        "rows": columns.rows,
+        "orders": len(columns),
+        "items": int(columns.items.sum()),
+        "spend": int(columns.price.sum()),
+        "unpriced_orders": int((~columns.priced).sum()),
+        "days": days,
+        "recipients": _table("recipient", columns.recipients, columns.recipient, columns),
+        "statuses": _table("status", columns.statuses, columns.status, columns, by="orders"),
+        "stuck": _stuck(columns, stuck_days, as_of or date.today()),
+    }
+
+
+def _stuck(columns: OrderColumns, stuck_days: int, as_of: date) -> dict[str, Any]:
+    # 配送状況の更新日時は保存していないため、注文日からの経過日数で判定する
+    edges = [stuck_days, stuck_days * 2, stuck_days * 4]
+    labels = [f"{edges[0] + 1}〜{edges[1]}日", f"{edges[1] + 1}〜{edges[2]}日", f"{edges[2] + 1}日以上"]
+    in_transit = columns.statuses.index(IN_TRANSIT_STATUS) if IN_TRANSIT_STATUS in columns.statuses else -1
+    ordered_on = columns.days[columns.day]
+    age = (np.datetime64(as_of, "D") - ordered_on).astype(np.int64)
+    stuck = np.flatnonzero((columns.status == in_transit) & ~np.isnat(ordered_on) & (age > stuck_days))
+    stuck = stuck[np.argsort(-age[stuck], kind="stable")]
+    bucket = np.searchsorted(edges[1:], age[stuck], side="left")
+    counts = np.bincount(bucket, minlength=len(labels)).tolist()
+    spend = np.bincount(bucket, weights=columns.price[stuck], minlength=len(labels)).astype(np.int64).tolist()
+    return {
+        "days": stuck_days,
+        "as_of": as_of.isoformat(),
+        "buckets": [
+            {"range": label, "orders": count, "spend": total}
+            for label, count, total in zip(labels, counts, spend)
+        ],
+        "orders": [
+            {
+                "account": columns.accounts[index],
+                "order_number": columns.order_numbers[index],
+                "date": str(ordered_on[index]),
+                "recipient": columns.recipients[columns.recipient[index]],
+                "age_days": int(age[index]),
+                "spend": int(columns.price[index]),
+            }
+            for index in stuck.tolist()
+        ],
+    }
+
+
+def write_json(report: dict[str, Any], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as handle:
+        json.dump(report, handle, ensure_ascii=False, indent=2)
+
+
+def format_report(report: dict[str, Any], top: int = 20) -> str:
+    """Render ``aggregate()``'s result as text tables; recipients and stuck orders are cut to ``top`` rows."""
+
+    def header(*columns: tuple[str, int]) -> str:
+        return "".join(pad(name, width, right=index > 0) for index, (name, width) in enumerate(columns))
+
+    def rest(rows: list) -> list[str]:
+        return [f"... ほか {len(rows) - top:,} 件"] if len(rows) > top else []
+
+    lines = [
+        f"行数 {report['rows']:,} / 注文 {report['orders']:,} 件 / 個数 {report['items']:,} / "
+        f"金額 ￥{report['spend']:,}"
+    ]
+    if report["unpriced_orders"]:
+        lines.append(f"金額を読み取れなかった注文: {report['unpriced_orders']:,} 件 (0円として集計)")
+    sections = (
+        ("日別", "年月日", 14, "date", report["days"], None),
+        ("お届け先別", "お届け先", 30, "recipient", report["recipients"], top),
+        ("ステータス別", "ステータス", 20, "status", report["statuses"], None),
+    )
+    for title, label, width, key, rows, limit in sections:
+        lines += ["", f"[{title}]", header((label, width), ("注文数", 10), ("個数", 10), ("金額", 16))]
+        lines += [
+            f"{pad(row[key] or '(空欄)', width)}{row['orders']:>10,}{row['items']:>10,}{row['spend']:>16,}"
+            for row in rows[:limit]
+        ]
+        if limit is not None:
+            lines += rest(rows)
+
+    stuck = report["stuck"]
+    lines += [
+        "",
+        f"[{IN_TRANSIT_STATUS}のまま {stuck['days']} 日を超えた注文 ({stuck['as_of']} 時点)]",
+        header(("経過日数", 20), ("注文数", 10), ("金額", 16)),
+    ]
+    lines += [
+        f"{pad(bucket['range'], 20)}{bucket['orders']:>10,}{bucket['spend']:>16,}"
+        for bucket in stuck["buckets"]
+    ]
+    if stuck["orders"]:
+        lines += ["", header(("注文番号", 24), ("年月日", 12), ("経過日数", 10)) + "  お届け先"]
+        lines += [
+            f"{pad(order['order_number'], 24)}{order['date']:>12}{order['age_days']:>10,}"
+            f"  {order['recipient']}"
+            for order in stuck["orders"][:top]
+        ]
+        lines += rest(stuck["orders"])
+    return "\n".join(lines)
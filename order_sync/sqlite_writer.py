@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Iterable
+
+from .models import ARRIVED_STATUS, RECORD_FIELDS, OrderRecord, StatusUpdate
+from .profiling import RunProfile
+
+COLUMNS = list(RECORD_FIELDS)
+# (アカウント, 注文番号, 商品名) ごとに1行を保持する
+KEY_COLUMNS = ("account", "order_number", "title")
+WRITE_CHUNK = 1000
+
+
+class SqliteWriter:
+    """Write records to an indexed SQLite table, upserted by order number and item title.
+
+    Downstream tools can query ``order_items`` (for example by ``updated_at``)
+    instead of re-reading the whole export. Without ``upsert`` the table is
+    replaced by this run's records; either way the change is committed in one
+    transaction, so readers never see a half-written run. The ``account``
+    column is empty for single-account runs.
+    """
+
+    def __init__(
+        self,
+        output_file: Path = Path("orders.sqlite3"),
+        profile: RunProfile | None = None,
+    ):
+        self.output_file = output_file
+        self.profile = profile or RunProfile()
+
+    def _connect(self) -> sqlite3.Connection:
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(self.output_file))
+        # 書き込み中も他のプロセスから前回の内容を読めるようにする
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS order_items ("
+            + ", ".join(f"{column} TEXT" for column in COLUMNS)
+            + ", updated_at REAL NOT NULL"
+            + f", PRIMARY KEY ({', '.join(KEY_COLUMNS)}))"
+        )
+        for column in ("order_number", "order_date", "status", "updated_at"):
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS order_items_{column} ON order_items ({column})"
+            )
+        return connection
+
+    def write(self, records: Iterable[OrderRecord], upsert: bool = False) -> int:
+        """Upsert ``records`` and return the number of rows written."""
+        placeholders = ", ".join("?" * (len(COLUMNS) + 1))
+        updates = ", ".join(
+            f"{column} = excluded.{column}"
+            for column in (*COLUMNS, "updated_at")
+            if column not in KEY_COLUMNS
+        )
+        statement = (
+            f"INSERT INTO order_items ({', '.join(COLUMNS)}, updated_at) VALUES ({placeholders}) "
+            f"ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO UPDATE SET {updates}"
+        )
+        connection = self._connect()
+        count = 0
+        elapsed = 0.0
+        try:
+            with connection:
+                if not upsert:
+                    connection.execute("DELETE FROM order_items")
+                iterator = iter(records)
+                while True:
+                    chunk = list(islice(iterator, WRITE_CHUNK))
+                    if not chunk:
+                        break
+                    started = time.perf_counter()
+                    now = time.time()
+                    connection.executemany(
+                        statement,
+                        [(*(getattr(record, column) for column in COLUMNS), now) for record in chunk],
+                    )
+                    count += len(chunk)
+                    elapsed += time.perf_counter() - started
+                started = time.perf_counter()
+            elapsed += time.perf_counter() - started
+        finally:
+            connection.close()
+        self.profile.add_time("sqlite_write", elapsed)
+        self.profile.count("sqlite_rows", count)
+        return count
+
+    def update_statuses(self, updates: Iterable[StatusUpdate]) -> int:
+        """Set the status columns of the orders in ``updates`` and return the number of rows changed.
+
+        Rows whose arrival already reads 到着済 keep that status, as in a full run.
+        """
+        statement = (
+            "UPDATE order_items SET status = ?, locker_message = ?, template_message = ?, updated_at = ? "
+            "WHERE account = ? AND order_number = ? AND instr(arrival, ?) = 0 "
+            "AND (status IS NOT ? OR locker_message IS NOT ? OR template_message IS NOT ?)"
+        )
+        started = time.perf_counter()
+        now = time.time()
+        connection = self._connect()
+        try:
+            before = connection.total_changes
+            with connection:
+                connection.executemany(
+                    statement,
+                    [
+                        (
+                            update.status,
+                            update.locker_message,
+                            update.template_message,
+                            now,
+                            update.account,
+                            update.order_number,
+                            ARRIVED_STATUS,
+                            update.status,
+                            update.locker_message,
+                            update.template_message,
+                        )
+                        for update in updates
+                    ],
+                )
+            changed = connection.total_changes - before
+        finally:
+            connection.close()
+        self.profile.add_time("sqlite_write", time.perf_counter() - started)
+        self.profile.count("status_updates", changed)
+        return changed
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+# これ以上変化しないため、次回以降はGmailを照会しないステータス
+TERMINAL_STATUSES = frozenset({"到着済", "キャンセル", "返金"})
+
+
+@dataclass
+class OrderState:
+    status: str
+    arrival: str
+    box: Optional[str] = None
+    pin: Optional[str] = None
+
+    @property
+    def is_terminal(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+
+class OrderStateStore:
+    """Last known status and arrival of each order, keyed by order number.
+
+    The ``watch`` command also keeps the mailbox ``historyId`` it has read up
+    to here.
+    """
+
+    def __init__(self, path: Path = Path("order_state.sqlite3")):
+        self.path = path
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS orders ("
+                "order_number TEXT PRIMARY KEY, status TEXT NOT NULL, arrival TEXT NOT NULL, "
+                "box TEXT, pin TEXT, updated_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS mailbox ("
+                "id INTEGER PRIMARY KEY CHECK (id = 1), history_id TEXT NOT NULL, polled_at REAL NOT NULL)"
+            )
+
+    def get_many(self, order_numbers: Iterable[str]) -> dict[str, OrderState]:
+        order_numbers = list(dict.fromkeys(order_numbers))
+        found: dict[str, OrderState] = {}
+        with self._lock:
+            for offset in range(0, len(order_numbers), 500):
+                chunk = order_numbers[offset : offset + 500]
+                rows = self._connection.execute(
+                    "SELECT order_number, status, arrival, box, pin FROM orders "
+                    f"WHERE order_number IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for order_number, status, arrival, box, pin in rows:
+                    found[order_number] = OrderState(status, arrival, box, pin)
+        return found
+
+    def put_many(self, states: dict[str, OrderState]) -> None:
+        if not states:
+            return
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO orders (order_number, status, arrival, box, pin, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (order_number, state.status, state.arrival, state.box, state.pin, now)
+                    for order_number, state in states.items()
+                ],
+            )
+
+    def get_history(self) -> tuple[str, float] | None:
+        """Return the ``historyId`` read up to and the time it was stored, or None before the first poll."""
+        with self._lock:
+            row = self._connection.execute("SELECT history_id, polled_at FROM mailbox").fetchone()
+        return (row[0], row[1]) if row is not None else None
+
+    def put_history(self, history_id: str, polled_at: float) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO mailbox (id, history_id, polled_at) VALUES (1, ?, ?)",
+                (history_id, polled_at),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime
+
+from .csv_writer import CsvWriter
+from .gmail_client import GmailClient, HistoryExpired, StatusDetector
+from .jsonl_writer import JsonlWriter
+from .models import arrival_overrides_status
+from .processing import OrderProcessor
+from .profiling import RunProfile
+from .sqlite_writer import SqliteWriter
+from .state_store import OrderState, OrderStateStore
+
+
+class MailboxWatcher:
+    """Apply the statuses of newly arrived Amazon mails to an existing export.
+
+    Each poll asks Gmail's ``users.history.list`` for the messages added since
+    the stored ``historyId``, runs the Amazon ones through ``StatusDetector``
+    and rewrites only the rows of the orders they mention. A quiet mailbox
+    costs one API call per poll. If the history has expired, the mails since
+    the last poll are found with a search instead. The first poll searches
+    from ``since`` (the time the export was written) so that mails arriving
+    between the export and the start of watching are applied too.
+    """
+
+    def __init__(
+        self,
+        gmail_client: GmailClient,
+        detector: StatusDetector,
+        processor: OrderProcessor,
+        writer: CsvWriter | SqliteWriter | JsonlWriter,
+        state_store: OrderStateStore,
+        account: str = "",
+        profile: RunProfile | None = None,
+        since: float | None = None,
+    ):
+        self.gmail_client = gmail_client
+        self.detector = detector
+        self.processor = processor
+        self.writer = writer
+        self.state_store = state_store
+        self.account = account
+        self.profile = profile or RunProfile()
+        self.since = since
+
+    def poll(self) -> int:
+        """Check the mailbox once and return the number of output rows updated."""
+        polled_at = time.time()
+        stored = self.state_store.get_history()
+        if stored is None:
+            print("Gmailの監視を開始しました。出力の作成以降に届いたメールのステータスを反映します。")
+            # 検索中に届いたメールを取りこぼさないよう、先に最新の historyId を控える
+            history_id = self.gmail_client.current_history_id()
+            message_ids = self.gmail_client.search_since(self.since) if self.since is not None else []
+        else:
+            history_id, last_polled = stored
+            try:
+                message_ids, history_id = self.gmail_client.list_history(history_id)
+            except HistoryExpired:
+                print("Gmailの履歴が保存期間を過ぎていたため、前回の確認以降のメールを検索します。")
+                history_id = self.gmail_client.current_history_id()
+                message_ids = self.gmail_client.search_since(last_polled)
+        updated = 0
+        if message_ids:
+            statuses = self.gmail_client.detect_new_mails(message_ids, self.detector)
+            if statuses:
+                updated = self.writer.update_statuses(
+                    [
+                        self.processor.status_update(order_number, status, box, pin, account=self.account)
+                        for order_number, (status, box, pin) in statuses.items()
+                    ]
+                )
+                self._update_states(statuses)
+        # 出力の更新に失敗した場合は同じ historyId から再度確認する
+        self.state_store.put_history(history_id, polled_at)
+        return updated
+
+    def _update_states(self, statuses: dict[str, tuple[str, str | None, str | None]]) -> None:
+        # --incremental の実行で確定済みとして扱えるよう、既知の注文の状態も更新する
+        states: dict[str, OrderState] = {}
+        for order_number, state in self.state_store.get_many(statuses).items():
+            if arrival_overrides_status(state.arrival):
+                continue
+            status, box, pin = statuses[order_number]
+            states[order_number] = OrderState(status, state.arrival, box, pin)
+        self.state_store.put_many(states)
+
+    def run(self, interval: float, once: bool = False) -> None:
+        """Poll every ``interval`` seconds until interrupted.
+
+        Errors after the first poll are reported and retried on the next one.
+        """
+        first = True
+        while True:
+            started = time.monotonic()
+            try:
+                updated = self.poll()
+            except Exception as exc:
+                if first or once:
+                    raise
+                print(f"{datetime.now():%H:%M:%S} Gmailの確認に失敗しました。次回再試行します: {exc}")
+            else:
+                if updated:
+                    print(f"{datetime.now():%H:%M:%S} {updated} 行のステータスを更新しました。")
+            first = False
+            if once:
+                return
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
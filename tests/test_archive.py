@@ -0,0 +1,24 @@
+"""Replaying recorded history pages with ``ArchiveOrderFetcher``."""
+from __future__ import annotations
+
+from pathlib import Path
+
+from benchmarks import fixtures
+from order_sync.archive import ArchiveOrderFetcher, RunArchive
+
+
+def test_replay_follows_next_link_past_page_without_dates(tmp_path: Path) -> None:
+    start, end = fixtures.window(20)
+    archive = RunArchive(tmp_path / "run.archive", mode="w")
+    # 解析できないカードだけのページにも「次へ」があれば、記録時と同様に次のページを開く
+    archive.put_page(end.year, 0, fixtures.history_page(0, 0))
+    archive.put_page(end.year, 1, fixtures.history_page(0, 10))
+    archive.put_page(end.year, 2, fixtures.history_page(10, 10, has_next=False))
+    archive.close()
+
+    replay = RunArchive(tmp_path / "run.archive")
+    try:
+        orders = ArchiveOrderFetcher(replay).fetch_orders(start, end)
+    finally:
+        replay.close()
+    assert [order.order_number for order in orders] == [fixtures.order_number(index) for index in range(20)]
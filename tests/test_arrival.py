@@ -0,0 +1,46 @@
+"""``ArrivalParser.format`` against a corpus of Amazon arrival texts."""
+from __future__ import annotations
+
+from datetime import date
+
+import pytest
+
+from order_sync.arrival import ArrivalParser
+
+# 2026-10-16 は金曜日。相対的な表記はこの日を基準に変換する
+REFERENCE_DATE = date(2026, 10, 16)
+
+CORPUS = [
+    ("10月16日にお届け済み", "10月16日到着済"),
+    ("配達済み 10月16日", "10月16日到着済"),
+    ("お届け予定: 10月18日", "10月18日到着予定"),
+    ("10月18日（金）にお届け予定", "10月18日到着予定"),
+    ("9月25日到着済", "9月25日到着済"),
+    ("2024/10/16にお届け済み", "10月16日到着済"),
+    ("10/16にお届け済み", "10月16日到着済"),
+    ("Oct 16にお届け済み", "10月16日到着済"),
+    ("明日にお届け", "10月17日到着予定"),
+    ("今日中にお届け", "10月16日到着予定"),
+    ("金曜日にお届け予定", "10月23日到着予定"),
+    ("土曜日 までにお届け", "10月17日到着予定"),
+    ("水曜日または月曜日にお届け", "10月19日到着予定"),
+    ("配達中", "不明"),
+    ("キャンセル済み", "不明"),
+    ("発送準備中", "不明"),
+    ("", "不明"),
+    # 以下は旧実装の出力が誤っていたもの
+    ("本日お届け予定", "10月16日到着予定"),
+    ("本日中にお届け", "10月16日到着予定"),
+    ("明後日にお届け", "10月18日到着予定"),
+    ("12月31日 - 1月2日にお届け予定", "12月31日到着予定"),
+    ("2個のうち1個が到着済", "2個のうち1個が到着済"),
+    ("到着済み 3日前", "到着済み 3日前"),
+    ("10月にお届け予定", "10月に到着予定"),
+    ("2月30日にお届け予定", "2月30日に到着予定"),
+    ("13月5日にお届け", "不明"),
+]
+
+
+@pytest.mark.parametrize("text, expected", CORPUS)
+def test_format(text: str, expected: str) -> None:
+    assert ArrivalParser(REFERENCE_DATE).format(text) == expected
@@ -0,0 +1,61 @@
+"""``--account`` must resolve the same ``[[accounts]]`` config for run and watch."""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from order_sync import cli
+
+CONFIG = """\
+[[accounts]]
+name = "a"
+
+[[accounts]]
+name = "b"
+cookies = "b-cookies.json"
+"""
+
+
+@pytest.fixture
+def config_file(tmp_path: Path) -> Path:
+    path = tmp_path / "config.toml"
+    path.write_text(CONFIG, encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("checkpoint", [None, "run.sqlite3"])
+def test_run_account(config_file: Path, checkpoint: str | None) -> None:
+    argv = ["--account", "a", "--config", str(config_file)]
+    if checkpoint is not None:
+        argv += ["--checkpoint", checkpoint]
+    args = cli.parse_args(argv)
+    settings = cli._load_settings(config_file)
+    (account,) = cli._select_accounts(
+        args, cli._load_accounts(settings, args.config, args, checkpoint=args.checkpoint)
+    )
+    run_args = cli._apply_account(args, account)
+
+    base = config_file.parent / cli.DEFAULT_ACCOUNTS_DIR / "a"
+    assert run_args.cookies == base / "cookies.json"
+    assert run_args.checkpoint == (base / cli.DEFAULT_CHECKPOINT.name if checkpoint else None)
+
+
+@pytest.mark.parametrize(
+    "name, cookies",
+    [("a", cli.DEFAULT_ACCOUNTS_DIR / "a" / "cookies.json"), ("b", Path("b-cookies.json"))],
+)
+def test_watch_account(config_file: Path, name: str, cookies: Path) -> None:
+    args = cli.parse_watch_args(["--account", name, "--once", "--config", str(config_file)])
+    account, run_args = cli._watch_account(cli._load_settings(config_file), args)
+
+    assert account is not None and account.name == name
+    assert run_args.cookies == config_file.parent / cookies
+    assert run_args.state == config_file.parent / cli.DEFAULT_ACCOUNTS_DIR / name / "order_state.sqlite3"
+    assert "checkpoint" not in vars(run_args)
+
+
+def test_watch_requires_one_account(config_file: Path) -> None:
+    args = cli.parse_watch_args(["--once", "--config", str(config_file)])
+    with pytest.raises(SystemExit):
+        cli._watch_account(cli._load_settings(config_file), args)
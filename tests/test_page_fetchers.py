@@ -0,0 +1,105 @@
+"""Concurrent history paging in ``HttpOrderFetcher`` and the driver pool scheduler."""
+from __future__ import annotations
+
+import threading
+from datetime import datetime
+from typing import Iterator
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from benchmarks import fixtures
+from order_sync.amazon import AmazonConfig, AmazonOrderFetcher, HistoryPage
+from order_sync.models import Order
+from order_sync.driver_pool import _PageScheduler
+from order_sync.http_fetcher import HttpOrderFetcher
+
+TOTAL = 40
+
+
+class FakeResponse:
+    def __init__(self, url: str, text: str):
+        self.url = url
+        self.text = text
+        self.content = text.encode("utf-8")
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class FakeSession:
+    """Serve ``TOTAL`` synthetic orders, ``page_size`` cards per page, by ``startIndex``."""
+
+    def __init__(self, page_size: int):
+        self.page_size = page_size
+
+    def get(self, url: str, timeout: float) -> FakeResponse:
+        first = int(parse_qs(urlparse(url).query).get("startIndex", ["0"])[0])
+        cards = max(0, min(self.page_size, TOTAL - first))
+        return FakeResponse(url, fixtures.history_page(first, cards, has_next=first + cards < TOTAL, filler=0))
+
+    def close(self) -> None:
+        pass
+
+
+class SerialFetcher(AmazonOrderFetcher):
+    """Follow the next links of ``FakeSession`` one page at a time, like the Selenium fetcher."""
+
+    def __init__(self, session: FakeSession):
+        super().__init__(AmazonConfig())
+        self.session = session
+        self.used = False
+
+    def iter_pages(self, start_date: datetime, end_date: datetime) -> Iterator[list[Order]]:
+        self.used = True
+        url = self._year_url(end_date.year)
+        while True:
+            page = self.parse_page(self.session.get(url, timeout=30).text, start_date, end_date)
+            yield page.orders
+            if not page.next_href:
+                return
+            url = f"{self.config.orders_url}{page.next_href}"
+
+
+def _fetch(page_size: int) -> tuple[list[str], SerialFetcher]:
+    session = FakeSession(page_size)
+    fallback = SerialFetcher(session)
+    fetcher = HttpOrderFetcher(AmazonConfig(orders_per_page=10), max_workers=3, fallback=fallback)
+    fetcher._create_session = lambda: session
+    start, end = fixtures.window(TOTAL)
+    return [order.order_number for order in fetcher.fetch_orders(start, end)], fallback
+
+
+def test_http_pages_by_start_index() -> None:
+    numbers, fallback = _fetch(page_size=10)
+    assert numbers == [fixtures.order_number(index) for index in range(TOTAL)]
+    assert not fallback.used
+
+
+@pytest.mark.parametrize("page_size", [8, 12])
+def test_http_falls_back_when_page_size_differs(page_size: int) -> None:
+    numbers, fallback = _fetch(page_size)
+    assert fallback.used
+    assert sorted(numbers) == sorted(fixtures.order_number(index) for index in range(TOTAL))
+    assert len(numbers) == len(set(numbers))
+
+
+def test_scheduler_limits_pages_ahead() -> None:
+    scheduler = _PageScheduler([2026], datetime(2026, 1, 1), max_ahead=2)
+    page = HistoryPage(order_dates=[datetime(2026, 10, 1)], next_href="?startIndex=10", cards=10)
+    assert scheduler.next_task() == (2026, 0)
+    assert scheduler.next_task() == (2026, 1)
+    scheduler.complete(2026, 0, page)
+    scheduler.complete(2026, 1, page)
+
+    tasks: list[tuple[int, int] | None] = []
+    driver = threading.Thread(target=lambda: tasks.append(scheduler.next_task()))
+    driver.start()
+    driver.join(timeout=0.2)
+    # 2ページ先まで解析済みのため、消費されるまで次のページを渡さない
+    assert driver.is_alive() and not tasks
+
+    assert scheduler.wait_for(2026, 0) is page
+    driver.join(timeout=1)
+    assert tasks == [(2026, 2)]
+    scheduler.stop()
@@ -0,0 +1,76 @@
+"""``MailboxWatcher.poll`` with an in-memory Gmail client and writer."""
+from __future__ import annotations
+
+from pathlib import Path
+
+from order_sync.gmail_client import HistoryExpired, StatusDetector
+from order_sync.processing import OrderProcessor
+from order_sync.state_store import OrderStateStore
+from order_sync.watch import MailboxWatcher
+
+
+class FakeGmailClient:
+    def __init__(self, history_id: str = "100"):
+        self.history_id = history_id
+        self.searches: list[float] = []
+        self.expired = False
+
+    def current_history_id(self) -> str:
+        return self.history_id
+
+    def search_since(self, since: float) -> list[str]:
+        self.searches.append(since)
+        return ["m1"]
+
+    def list_history(self, start_history_id: str) -> tuple[list[str], str]:
+        if self.expired:
+            raise HistoryExpired(start_history_id)
+        return [], self.history_id
+
+    def detect_new_mails(self, message_ids, detector):
+        return {"503-0000000-0000001": ("発送済み", None, None)} if message_ids else {}
+
+
+class FakeWriter:
+    def __init__(self):
+        self.updates = []
+
+    def update_statuses(self, updates) -> int:
+        self.updates.extend(updates)
+        return len(updates)
+
+
+def _watcher(tmp_path: Path, gmail_client: FakeGmailClient, since: float | None) -> MailboxWatcher:
+    detector = StatusDetector()
+    return MailboxWatcher(
+        gmail_client=gmail_client,
+        detector=detector,
+        processor=OrderProcessor(detector=detector, gmail_client=gmail_client),
+        writer=FakeWriter(),
+        state_store=OrderStateStore(tmp_path / "state.sqlite3"),
+        since=since,
+    )
+
+
+def test_first_poll_applies_mails_since_export(tmp_path: Path) -> None:
+    gmail_client = FakeGmailClient()
+    watcher = _watcher(tmp_path, gmail_client, since=1_700_000_000.0)
+
+    assert watcher.poll() == 1
+    assert gmail_client.searches == [1_700_000_000.0]
+    assert [update.order_number for update in watcher.writer.updates] == ["503-0000000-0000001"]
+    assert watcher.state_store.get_history()[0] == "100"
+
+    # 2回目以降は履歴だけを確認する
+    assert watcher.poll() == 0
+    assert gmail_client.searches == [1_700_000_000.0]
+
+
+def test_expired_history_searches_since_last_poll(tmp_path: Path) -> None:
+    gmail_client = FakeGmailClient()
+    watcher = _watcher(tmp_path, gmail_client, since=None)
+    watcher.state_store.put_history("50", 1_600_000_000.0)
+    gmail_client.expired = True
+
+    assert watcher.poll() == 1
+    assert gmail_client.searches == [1_600_000_000.0]